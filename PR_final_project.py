@@ -14,11 +14,154 @@ Note:
     repository
 
 """
+import csv
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+import warnings
 import numpy as np
-import matplotlib.pyplot as plt
 from multiprocessing import Pool
-from functools import partial
-from tqdm import tqdm
+# matplotlib and tqdm are imported where they are used, so that runs without plots or progress bars do not load them
+
+
+class _Stage:
+    """
+        Timer of one stage of a Profiler, the time spent in nested stages is left out of its self time
+        """
+    __slots__ = ('profiler', 'name', 'start', 'nested')
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.nested = 0.0
+        self.profiler._stack.append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.profiler._stack.pop()
+        if self.profiler._stack:
+            self.profiler._stack[-1].nested += elapsed
+        calls, total, own = self.profiler.stages.get(self.name, (0, 0.0, 0.0))
+        self.profiler.stages[self.name] = (calls + 1, total + elapsed, own + elapsed - self.nested)
+
+
+class _NoStage:
+    """
+        Stage of a disabled Profiler, does nothing
+        """
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class Profiler:
+    """
+        Instrumentation of the stages of a run, switched off unless enabled is set
+        Records the wall time and number of calls of each stage (variables, model, ledger, pool, postprocess, aggregate),
+        counters such as the random draws, the simulations and the bytes sent to and received from the worker processes,
+        and the time and tasks of each worker. Worker processes send their records back with each task and they are
+        merged into the parent's. When disabled, a stage costs one attribute check
+        >>> profiler = Profiler()
+        >>> profiler.enabled = True
+        >>> with profiler.stage('model'):
+        ...     with profiler.stage('ledger'):
+        ...         profiler.count('random_draws', 8)
+        >>> profiler.stages['model'][0], profiler.counters
+        (1, {'random_draws': 8})
+        >>> other = Profiler()
+        >>> other.merge(profiler.snapshot())
+        >>> other.stages['ledger'][0], other.counters
+        (1, {'random_draws': 8})
+        """
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        """
+        Discards everything recorded so far
+        """
+        self.stages = {}
+        self.counters = {}
+        self.workers = {}
+        self._stack = []
+
+    def stage(self, name: str):
+        """
+        :param name: Name of the stage
+        :return: Context manager timing the stage
+        """
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def count(self, name: str, value: int = 1):
+        """
+        Adds to a counter
+        :param name: Name of the counter
+        :param value: Amount to add
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """
+        :return: Everything recorded so far, as plain data which can be pickled or written as JSON
+        """
+        return {'stages': {name: {'calls': calls, 'seconds': total, 'self_seconds': own} for name, (calls, total, own) in self.stages.items()},
+                'counters': dict(self.counters),
+                'workers': {str(pid): dict(usage) for pid, usage in self.workers.items()}}
+
+    def merge(self, snapshot: dict):
+        """
+        Adds the records of another profiler, e.g. of a worker process
+        :param snapshot: Result of snapshot()
+        """
+        for name, stage in snapshot['stages'].items():
+            calls, total, own = self.stages.get(name, (0, 0.0, 0.0))
+            self.stages[name] = (calls + stage['calls'], total + stage['seconds'], own + stage['self_seconds'])
+        for name, value in snapshot['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for pid, usage in snapshot['workers'].items():
+            total = self.workers.setdefault(pid, {})
+            for name, value in usage.items():
+                total[name] = total.get(name, 0) + value
+
+    def report(self) -> str:
+        """
+        :return: Text summary of the records
+        """
+        lines = ['%-12s %10s %12s %12s' % ('stage', 'calls', 'seconds', 'self seconds')]
+        for name, (calls, total, own) in sorted(self.stages.items(), key=lambda item: -item[1][2]):
+            lines.append('%-12s %10d %12.4f %12.4f' % (name, calls, total, own))
+        for name, value in sorted(self.counters.items()):
+            lines.append('%-24s %d' % (name, value))
+        if self.counters.get('simulations'):
+            lines.append('%-24s %.1f' % ('random_draws/simulation', self.counters.get('random_draws', 0) / self.counters['simulations']))
+        for pid, usage in sorted(self.workers.items()):
+            lines.append('worker %-8s tasks %6d  simulations %8d  seconds %10.4f' % (pid, usage.get('tasks', 0), usage.get('simulations', 0), usage.get('seconds', 0.0)))
+        return '\n'.join(lines)
+
+    def to_json(self) -> str:
+        """
+        :return: JSON summary of the records
+        """
+        return json.dumps(self.snapshot(), indent=2)
+
+
+# Profiler of this process, set PROFILER.enabled = True to record a run
+PROFILER = Profiler()
 
 
 def ran_pert_dist(minimum: float, most_likely: float, maximum: float, confidence: float, samples: int) -> float:
@@ -41,6 +184,24 @@ def ran_pert_dist(minimum: float, most_likely: float, maximum: float, confidence
         ...         print("True")
         True
         """
+    a, b = pert_beta_parameters(minimum, most_likely, maximum, confidence)
+
+    beta = np.random.beta(a, b, samples)
+    beta = beta * (maximum - minimum) + minimum
+    return beta
+
+
+def pert_beta_parameters(minimum: float, most_likely: float, maximum: float, confidence: float) -> tuple:
+    """Convert a 'Modified PERT' specification into the parameters of the underlying beta distribution.
+
+        :param minimum: The lowest value expected as possible.
+        :param most_likely: The 'most likely' value, statistically, the mode.
+        :param maximum: The highest value expected as possible.
+        :param confidence: The 'lambda' of the Modified PERT distribution, allows values 1-18
+        :return: a, b: shape parameters of the beta distribution on [0, 1]
+        >>> pert_beta_parameters(1, 3, 5, confidence=4)
+        (3.0, 3.0)
+        """
     # Check for reasonable confidence levels to allow:
     if confidence < 1 or confidence > 18:
         raise ValueError('confidence value must be in range 1-18.')
@@ -49,10 +210,134 @@ def ran_pert_dist(minimum: float, most_likely: float, maximum: float, confidence
 
     a = (mean - minimum) / (maximum - minimum) * (confidence + 2)
     b = ((confidence + 1) * maximum - minimum - confidence * most_likely) / (maximum - minimum)
+    return a, b
 
-    beta = np.random.beta(a, b, samples)
-    beta = beta * (maximum - minimum) + minimum
-    return beta
+
+class PertSampler:
+    """
+        Hands out draws of one 'Modified PERT' distribution from a large pre-filled block of samples
+        The PERT specification is converted to beta parameters once, the block is refilled when it runs out
+        >>> sampler = PertSampler(1, 3, 5, confidence=4, block_size=4)
+        >>> x = sampler.draw()
+        >>> if 1 <= x <= 5:
+        ...         print("True")
+        True
+        >>> sampler.draw(10).shape
+        (10,)
+        """
+    def __init__(self, minimum: float, most_likely: float, maximum: float, confidence: float, block_size: int = 65536):
+        """
+        :param minimum: The lowest value expected as possible.
+        :param most_likely: The 'most likely' value, statistically, the mode.
+        :param maximum: The highest value expected as possible.
+        :param confidence: The 'lambda' of the Modified PERT distribution, allows values 1-18
+        :param block_size: Number of samples generated each time the block is refilled
+        """
+        self.minimum = minimum
+        self.most_likely = most_likely
+        self.maximum = maximum
+        self.confidence = confidence
+        self.block_size = block_size
+        self.a, self.b = pert_beta_parameters(minimum, most_likely, maximum, confidence)
+        self._block = np.empty(0)
+        self._position = 0
+        self._cdf = None
+        self._grid = None
+
+    def _refill(self, needed: int):
+        """
+        Replaces the block with the unused samples followed by at least needed new samples
+        :param needed: Number of samples the next draw requires
+        """
+        left = self._block[self._position:]
+        new = np.random.beta(self.a, self.b, max(self.block_size, needed - len(left)))
+        if PROFILER.enabled:
+            PROFILER.count('random_generated', len(new))
+        new = new * (self.maximum - self.minimum) + self.minimum
+        self._block = np.concatenate((left, new))
+        self._position = 0
+
+    def draw(self, size=None):
+        """
+        Takes the next samples out of the block
+        :param size: Number of samples or shape of the array of samples, a single sample when None
+        :return: A single sample or an array of samples
+        """
+        needed = 1 if size is None else int(np.prod(size))
+        if PROFILER.enabled:
+            PROFILER.count('random_draws', needed)
+        if self._position + needed > len(self._block):
+            self._refill(needed)
+        samples = self._block[self._position:self._position + needed]
+        self._position += needed
+        if size is None:
+            return samples[0]
+        return samples.reshape(size)
+
+    def reset(self):
+        """
+        Discards the samples left in the block, e.g. after the random state has been seeded again
+        """
+        self._block = np.empty(0)
+        self._position = 0
+
+    def ppf(self, quantiles):
+        """
+        Inverse CDF of the distribution, from a table of the beta CDF built on first use
+        Maps uniform numbers (stratified, quasi-random or antithetic) to samples of the distribution
+        :param quantiles: Numbers between 0 and 1
+        :return: Samples of the distribution at the given quantiles
+        >>> PertSampler(1, 3, 5, confidence=4).ppf([0, 0.5, 1]).round(3).tolist()
+        [1.0, 3.0, 5.0]
+        """
+        if self._cdf is None:
+            grid = np.linspace(0, 1, 4097)
+            pdf = grid ** (self.a - 1) * (1 - grid) ** (self.b - 1)
+            cdf = np.concatenate(([0.0], np.cumsum((pdf[1:] + pdf[:-1]) / 2)))
+            self._cdf, self._grid = cdf / cdf[-1], grid
+        return np.interp(quantiles, self._cdf, self._grid) * (self.maximum - self.minimum) + self.minimum
+
+
+SAMPLING_STRATEGIES = ('plain', 'latin_hypercube', 'sobol', 'antithetic')
+# Number of consecutive simulation IDs stratified together by the strategies other than plain, whatever the chunks of a run;
+# a power of 2 keeps the balance of the Sobol points
+STRATIFICATION_BLOCK = 256
+
+
+def uniform_design(strategy: str, number_of_simulation: int, dimensions: int, rng: np.random.Generator) -> np.ndarray:
+    """
+        Uniform numbers of a block of simulations for one of the SAMPLING_STRATEGIES
+        plain: independent uniforms, latin_hypercube: one uniform in each of number_of_simulation strata of every dimension,
+        sobol: scrambled Sobol sequence (needs scipy), antithetic: pairs of adjacent simulations (2k, 2k + 1) using u and 1 - u
+        :param strategy: Name of the sampling strategy
+        :param number_of_simulation: Number of simulations, the points of the design
+        :param dimensions: Number of uniform numbers per simulation
+        :param rng: Random number generator of the block
+        :return: Array of uniform numbers of shape (number_of_simulation, dimensions)
+        >>> design = uniform_design('latin_hypercube', 4, 3, np.random.default_rng(1))
+        >>> np.sort(np.floor(design * 4), axis=0).T.tolist()
+        [[0.0, 1.0, 2.0, 3.0], [0.0, 1.0, 2.0, 3.0], [0.0, 1.0, 2.0, 3.0]]
+        >>> design = uniform_design('antithetic', 4, 3, np.random.default_rng(1))
+        >>> bool(np.allclose(design[0::2] + design[1::2], 1))
+        True
+        """
+    if strategy == 'plain':
+        return rng.random((number_of_simulation, dimensions))
+    if strategy == 'latin_hypercube':
+        strata = np.argsort(rng.random((number_of_simulation, dimensions)), axis=0)
+        return (strata + rng.random((number_of_simulation, dimensions))) / number_of_simulation
+    if strategy == 'antithetic':
+        # Adjacent rows are paired so that any even slice of a block still holds whole pairs
+        half = rng.random(((number_of_simulation + 1) // 2, dimensions))
+        return np.stack((half, 1 - half), axis=1).reshape(-1, dimensions)[:number_of_simulation]
+    if strategy == 'sobol':
+        from scipy.stats import qmc
+
+        with warnings.catch_warnings():
+            # The balance of Sobol points is best for powers of 2 but any number of points can be used
+            warnings.simplefilter('ignore', UserWarning)
+            return qmc.Sobol(dimensions, scramble=True, seed=rng).random(number_of_simulation)
+    raise ValueError('strategy must be one of %s.' % ', '.join(SAMPLING_STRATEGIES))
 
 
 class Variables:
@@ -64,6 +349,141 @@ class Variables:
         I = Infected
         R = Result (used interchangeably with the term outcome in the code)
         """
+    # Pre-generated sample pools, one for each PERT distributed variable
+    # infectious rate, time_to_outcome, outcome_rate - https://www.inverse.com/mind-body/how-long-are-you-infectious-when-you-have-coronavirus
+    infectious_period = PertSampler(8, 10, 14, confidence=4)
+    # incubation rate - https://www.medscape.com/answers/2500114-197431/what-is-the-incubation-period-for-coronavirus-disease-2019-covid-19
+    incubation_period = PertSampler(2, 5, 14, confidence=4)
+    # arrival rate - https://www.cdc.gov/coronavirus/2019-ncov/covid-data/covidview/05012020/covid-like-illness.html
+    arrival_rate = PertSampler(1.70, 1.92, 4.46, confidence=4)
+    # probability of people testing positive for COVID-19 - https://www.cdc.gov/coronavirus/2019-ncov/covid-data/covidview/index.html
+    prob_positive = PertSampler(0.10, 0.18, 0.22, confidence=3)
+    test_result_time = PertSampler(1, 2, 7, confidence=4)
+    time_to_outcome = PertSampler(8, 10, 14, confidence=4)
+    outcome_period = PertSampler(8, 10, 14, confidence=4)
+
+    @staticmethod
+    def samplers() -> list:
+        """
+        :return: All the sample pools of the class
+        >>> len(Variables.samplers())
+        7
+        """
+        return [Variables.infectious_period, Variables.incubation_period, Variables.arrival_rate, Variables.prob_positive,
+                Variables.test_result_time, Variables.time_to_outcome, Variables.outcome_period]
+
+    @staticmethod
+    def batch_samplers() -> list:
+        """
+        Samplers in the order in which model() uses them each day: s_e() twice, e_i() and i_r()
+        :return: Sampler of each daily draw
+        >>> len(Variables.batch_samplers())
+        8
+        """
+        return [Variables.infectious_period, Variables.infectious_period, Variables.incubation_period, Variables.arrival_rate,
+                Variables.prob_positive, Variables.test_result_time, Variables.time_to_outcome, Variables.outcome_period]
+
+    @staticmethod
+    def draw_batch(number_of_simulation: int, number_of_days: int, simulation_ids=None, seed: int = None, strategy: str = 'plain') -> np.ndarray:
+        """
+        Draws every daily variable of every simulation, in the order of batch_samplers()
+        Without a seed the draws come from the sample pools, with a seed each simulation draws from its own
+        random stream so that its draws do not depend on which other simulations are drawn together.
+        The streams are drawn day by day, so the draws of a shorter horizon are the first days of a longer one
+        Any other strategy than plain draws each block of STRATIFICATION_BLOCK consecutive simulation IDs together from
+        uniform_design() through the PERT inverse CDF, so the draws of a simulation still depend only on the seed and its ID
+        :param number_of_simulation: Number of simulations to draw for
+        :param number_of_days: Number of days for which the simulation has to run
+        :param simulation_ids: IDs of the simulations, 0 to number_of_simulation - 1 when None
+        :param seed: Master seed of the random streams
+        :param strategy: One of SAMPLING_STRATEGIES
+        :return: Array of draws of shape (8, number_of_simulation, number_of_days)
+        >>> together = Variables.draw_batch(3, 5, seed=7)
+        >>> alone = Variables.draw_batch(1, 5, simulation_ids=[2], seed=7)
+        >>> bool((together[:, 2] == alone[:, 0]).all())
+        True
+        >>> bool((Variables.draw_batch(3, 2, seed=7) == together[:, :, :2]).all())
+        True
+        >>> stratified = Variables.draw_batch(300, 2, seed=7, strategy='latin_hypercube')
+        >>> bool((Variables.draw_batch(50, 2, range(250, 300), seed=7, strategy='latin_hypercube') == stratified[:, 250:]).all())
+        True
+        """
+        samplers = Variables.batch_samplers()
+        shape = (number_of_simulation, number_of_days)
+        if simulation_ids is None:
+            simulation_ids = range(number_of_simulation)
+        # The sample pools count their own draws
+        if strategy != 'plain' or seed is not None:
+            PROFILER.count('random_draws', len(samplers) * number_of_simulation * number_of_days)
+        with PROFILER.stage('variables'):
+            if strategy != 'plain':
+                simulation_ids = np.asarray(simulation_ids)
+                blocks = simulation_ids // STRATIFICATION_BLOCK
+                draws = np.empty((len(samplers),) + shape)
+                for block in np.unique(blocks):
+                    # One stream per block, keyed by its first simulation ID and its size
+                    first = int(block) * STRATIFICATION_BLOCK
+                    rng = np.random.default_rng(None if seed is None else np.random.SeedSequence(seed, spawn_key=(first, STRATIFICATION_BLOCK)))
+                    design = uniform_design(strategy, STRATIFICATION_BLOCK, number_of_days * len(samplers), rng)
+                    rows = blocks == block
+                    design = design.reshape(STRATIFICATION_BLOCK, number_of_days, len(samplers))[simulation_ids[rows] - first]
+                    draws[:, rows] = np.stack([sampler.ppf(design[:, :, k]) for k, sampler in enumerate(samplers)])
+                return draws
+            if seed is None:
+                return np.stack([sampler.draw(shape) for sampler in samplers])
+            return Variables.draw_streams([simulation_stream(seed, simulation_id) for simulation_id in simulation_ids], number_of_days)
+
+    @staticmethod
+    def draw_streams(streams: list, number_of_days: int, regions: int = None) -> np.ndarray:
+        """
+        Draws every daily variable of each simulation from its own random stream, in the order of batch_samplers()
+        The days are drawn in order, so drawing a horizon in several calls on the same streams gives the same draws as
+        a single call; each stream is left after its last draw
+        :param streams: Random stream of each simulation
+        :param number_of_days: Number of days to draw
+        :param regions: Number of regions drawn together from each stream, None for a single region
+        :return: Array of draws of shape (8, len(streams), number_of_days), or (8, regions, len(streams), number_of_days) with regions
+        >>> streams = [simulation_stream(7, 0), simulation_stream(7, 1)]
+        >>> first_days, next_days = Variables.draw_streams(streams, 2), Variables.draw_streams(streams, 3)
+        >>> bool((np.concatenate([first_days, next_days], axis=2) == Variables.draw_batch(2, 5, seed=7)).all())
+        True
+        """
+        samplers = Variables.batch_samplers()
+        size = (number_of_days, len(samplers)) if regions is None else (number_of_days, regions, len(samplers))
+        a = np.array([sampler.a for sampler in samplers])
+        b = np.array([sampler.b for sampler in samplers])
+        draws = np.empty((len(samplers),) + size[1:-1] + (len(streams), number_of_days))
+        for column, stream in enumerate(streams):
+            draws[..., column, :] = stream.beta(a, b, size).T
+        scale = (len(samplers),) + (1,) * (draws.ndim - 1)
+        minimum = np.array([sampler.minimum for sampler in samplers]).reshape(scale)
+        maximum = np.array([sampler.maximum for sampler in samplers]).reshape(scale)
+        return draws * (maximum - minimum) + minimum
+
+    @staticmethod
+    def draw_regions(simulation_ids, number_of_days: int, regions: int, seed: int) -> np.ndarray:
+        """
+        Draws every daily variable of every region of a block of simulations, in the order of batch_samplers()
+        Each simulation draws all its regions from its own random stream in one go, day by day as in draw_batch(),
+        so the draws of a simulation do not depend on the block it is drawn in
+        :param simulation_ids: IDs of the simulations
+        :param number_of_days: Number of days for which the simulation has to run
+        :param regions: Number of regions
+        :param seed: Master seed of the random streams
+        :return: Array of draws of shape (8, regions * len(simulation_ids), number_of_days), the rows of the first region
+                 come first, then those of the next one
+        >>> together = Variables.draw_regions([0, 1, 2], 4, 2, seed=7)
+        >>> alone = Variables.draw_regions([2], 4, 2, seed=7)
+        >>> bool((together[:, [2, 5]] == alone).all()), bool((Variables.draw_regions([2], 3, 2, seed=7) == alone[:, :, :3]).all())
+        (True, True)
+        """
+        samplers = Variables.batch_samplers()
+        simulation_ids = list(simulation_ids)
+        PROFILER.count('random_draws', len(samplers) * regions * len(simulation_ids) * number_of_days)
+        with PROFILER.stage('variables'):
+            draws = Variables.draw_streams([simulation_stream(seed, simulation_id) for simulation_id in simulation_ids], number_of_days, regions)
+        return draws.reshape(len(samplers), regions * len(simulation_ids), number_of_days)
+
     # concept of transition between compartments - https://www.datahubbs.com/social-distancing-to-slow-the-coronavirus/
     @staticmethod
     def s_e():  # s = Susceptible    ;   e= Exposed
@@ -81,7 +501,7 @@ class Variables:
         Pass
         """
         # infectious rate - https://www.inverse.com/mind-body/how-long-are-you-infectious-when-you-have-coronavirus
-        infectious_rate = np.random.choice(1.0 / (ran_pert_dist(8, 10, 14, confidence=4, samples=1000)))  # beta
+        infectious_rate = 1.0 / Variables.infectious_period.draw()  # beta
         return infectious_rate
 
     @staticmethod
@@ -105,12 +525,12 @@ class Variables:
         True
         """
         # incubation rate - https: // www.inverse.com / mind - body / how - long - are - you - infectious - when - you - have - coronavirus, https://www.medscape.com/answers/2500114-197431/what-is-the-incubation-period-for-coronavirus-disease-2019-covid-19
-        incubation_rate = np.random.choice(1.0 / ran_pert_dist(2, 5, 14, confidence=4, samples=1000))  # alpha
+        incubation_rate = 1.0 / Variables.incubation_period.draw()  # alpha
         # arrival rate - https://www.cdc.gov/coronavirus/2019-ncov/covid-data/covidview/05012020/covid-like-illness.html
-        arrival_rate = np.random.choice(ran_pert_dist(1.70, 1.92, 4.46, confidence=4, samples=1000))
+        arrival_rate = Variables.arrival_rate.draw()
         # probability of people testing positive for COVID-19 - https://www.cdc.gov/coronavirus/2019-ncov/covid-data/covidview/index.html?CDC_AA_refVal=https%3A%2F%2Fwww.cdc.gov%2Fcoronavirus%2F2019-ncov%2Fcovid-data%2Fcovidview.html
-        prob_positive = np.random.choice(ran_pert_dist(0.10, 0.18, 0.22, confidence=3, samples=1000))
-        time_test_result = int(np.random.choice(ran_pert_dist(1, 2, 7, confidence=4, samples=1000)))
+        prob_positive = Variables.prob_positive.draw()
+        time_test_result = int(Variables.test_result_time.draw())
         return incubation_rate, arrival_rate, prob_positive, time_test_result
 
     @staticmethod
@@ -130,31 +550,129 @@ class Variables:
         True
         """
         # time_to_outcome, outcome_rate - https://www.inverse.com/mind-body/how-long-are-you-infectious-when-you-have-coronavirus
-        time_to_outcome = int(np.random.choice(ran_pert_dist(8, 10, 14, confidence=4, samples=1000)))
-        outcome_rate = np.random.choice(1.0 / ran_pert_dist(8, 10, 14, confidence=4, samples=1000))
+        time_to_outcome = int(Variables.time_to_outcome.draw())
+        outcome_rate = 1.0 / Variables.outcome_period.draw()
         return time_to_outcome, outcome_rate
 
 
+class BedLedger:
+    """
+        Event calendar of the hospital beds
+        Every admission is booked on the day the test result arrives and every discharge on the day the outcome arrives,
+        the daily series are then built in a single pass over the calendar
+        Events which land after the last simulated day are not placed on the calendar but are counted as pending
+        The ledger keeps one calendar per simulation when number_of_simulation is given
+        >>> ledger = BedLedger(500, 4)
+        >>> ledger.admit([1, 2, 6], [10, 5, 7])
+        >>> ledger.discharge([3, 5], [4, 2])
+        >>> ledger.available.tolist(), ledger.pending_admissions, ledger.pending_discharges
+        ([500.0, 490.0, 485.0, 489.0], 7.0, 2.0)
+        """
+    def __init__(self, number_of_beds, number_of_days: int, number_of_simulation: int = None):
+        """
+        :param number_of_beds: Total number of hospital beds, a single number or one per simulation
+        :param number_of_days: Number of days covered by the calendar
+        :param number_of_simulation: Number of simulations booked together, None for a single simulation
+        """
+        self.number_of_days = number_of_days
+        self.number_of_simulation = number_of_simulation
+        rows = 1 if number_of_simulation is None else number_of_simulation
+        self.number_of_beds = number_of_beds if np.ndim(number_of_beds) == 0 else np.reshape(number_of_beds, (-1, 1))
+        self._admissions = np.zeros((rows, number_of_days))
+        self._discharges = np.zeros((rows, number_of_days))
+        self._pending_admissions = np.zeros(rows)
+        self._pending_discharges = np.zeros(rows)
+
+    def _book(self, calendar: np.ndarray, pending: np.ndarray, day, patients):
+        """
+        Adds the patients of every event to the calendar on their day, or to pending when the day is after the calendar
+        :param calendar: Calendar of admissions or discharges
+        :param pending: Patients of the events after the calendar, one entry per simulation
+        :param day: Day of each event, shape (events,) or (number_of_simulation, events)
+        :param patients: Number of patients of each event, same shape as day
+        """
+        rows, days = calendar.shape
+        day = np.asarray(day, dtype=np.int64).reshape(rows, -1)
+        patients = np.broadcast_to(np.asarray(patients, dtype=float).reshape(rows, -1), day.shape)
+        inside = day < days
+        slots = (np.arange(rows)[:, None] * days + day)[inside]
+        calendar += np.bincount(slots, weights=patients[inside], minlength=calendar.size).reshape(rows, days)
+        pending += np.where(inside, 0.0, patients).sum(axis=1)
+
+    def _series(self, calendar: np.ndarray):
+        """
+        :param calendar: Calendar with one row per simulation
+        :return: The calendar in the shape of a single simulation when the ledger has no number_of_simulation
+        """
+        if self.number_of_simulation is None:
+            return calendar[0] if calendar.ndim == 2 else calendar[0].item()
+        return calendar
+
+    def admit(self, day, patients):
+        """
+        Books the admissions of hospitalized patients
+        :param day: Day on which the test result arrives for each group of patients
+        :param patients: Number of patients admitted in each group
+        """
+        self._book(self._admissions, self._pending_admissions, day, patients)
+
+    def discharge(self, day, patients):
+        """
+        Books the discharges of recovered/dead patients
+        :param day: Day on which the outcome arrives for each group of patients
+        :param patients: Number of patients discharged in each group
+        """
+        self._book(self._discharges, self._pending_discharges, day, patients)
+
+    @property
+    def admissions(self):
+        """Patients admitted on each day"""
+        return self._series(self._admissions)
+
+    @property
+    def discharges(self):
+        """Patients discharged on each day"""
+        return self._series(self._discharges)
+
+    @property
+    def pending_admissions(self):
+        """Patients whose admission falls after the last day"""
+        return self._series(self._pending_admissions)
+
+    @property
+    def pending_discharges(self):
+        """Patients whose discharge falls after the last day"""
+        return self._series(self._pending_discharges)
+
+    @property
+    def occupancy(self):
+        """Beds occupied at the end of each day"""
+        return self._series(np.cumsum(self._admissions - self._discharges, axis=1))
+
+    @property
+    def available(self):
+        """Beds available at the end of each day"""
+        return self.number_of_beds - self.occupancy
+
+
 def admitted_bed(number_of_days: int, new_days: list, lst_outcome: list, lst_day_out: list, lst_hospitalized: list, number_of_beds: int) -> tuple:
     """
         This function calculates the number of hospital beds that are remaining after being occupied by hospitalized patients
+        Patients are admitted on the day their test result arrives
         :param number_of_days:  Number of days considered for each iteration of the simulation
-        :param new_days: List containing the number of days after which the test result are coming out
+        :param new_days: List containing the day on which the test result of each group of patients is coming out
         :param lst_outcome: List of number of patients with some outcome. Either recovered or dead
-        :param lst_day_out: List of number of days for each day in simulation, after which the outcome is received
+        :param lst_day_out: List containing the day on which the outcome of each group of patients is received
         :param lst_hospitalized: List of number of patients who are hospitalized after being tested for infection
         :param number_of_beds: Available number of hospital beds in the given city
         :return: beds_available: Number of available beds on a given day based on the admitted patients and outcome patients,
                      num_x_days: The days to be plotted on x-axis in the graph
-        >>> admitted_bed(2, [5,10],  [40,28], [23,33], [10, 5], 500)
-        ([530, 513], [0, 1])
-        """
-    admitted_beds = []
-    for i in range(number_of_days):
-        for j in range(new_days[i] + 1):
-            if j == new_days[i]:
-                number_of_beds = number_of_beds - lst_hospitalized[i]
-                admitted_beds.append(number_of_beds)
+        >>> admitted_bed(4, [1, 2],  [4, 2], [3, 5], [10, 5], 500)
+        ([500.0, 490.0, 485.0, 489.0], [0, 1, 2, 3])
+        """
+    ledger = BedLedger(number_of_beds, number_of_days)
+    ledger.admit(new_days, lst_hospitalized)
+    admitted_beds = ledger.available.tolist()
     beds_available, num_x_days = available_bed(number_of_days, lst_outcome, lst_day_out, number_of_beds, admitted_beds)
     return beds_available, num_x_days
 
@@ -162,55 +680,42 @@ def admitted_bed(number_of_days: int, new_days: list, lst_outcome: list, lst_day
 def available_bed(number_of_days: int, lst_outcome: list, lst_day_out: list, number_of_beds: list, admitted_beds: list) -> tuple:
     """
         This function gives the number of available beds remaining after admitting the infected patients and discharging the recovered/dead patients
-        It keeps on updating the number of available beds based on the admitted patients and  outcome patients
+        Patients are discharged on the day their outcome arrives and stay discharged for the rest of the simulation
         :param number_of_days: Number of days for which each iteration of the simulation has to run
         :param lst_outcome:  List of number of patients with some outcome. Either recovered or dead
-        :param lst_day_out:  List of number of days for each day in simulation, after which the outcome is recieved
+        :param lst_day_out:  List containing the day on which the outcome of each group of patients is received
         :param number_of_beds:  Available number of hospital beds in the given city
-        :param admitted_beds: List of beds after admitting the patients
+        :param admitted_beds: List of available beds on each day after admitting the patients
         :return: available_beds: List of available beds on a given day based on the admitted patients and outcome (recovered/dead) patients,
                      x_num_days: The days to be plotted on x-axis in the graph
-        >>> available_bed(2, [40,28],[23,33], [2000, 1900], [345, 400])
-        ([385, 428], [0, 1])
+        >>> available_bed(3, [40, 28], [1, 5], 500, [480, 470, 460])
+        ([480.0, 510.0, 500.0], [0, 1, 2])
         """
-    x_num_days = []
-    available_beds = []
-    for i in range(number_of_days):
-        x_num_days.append(i)
-
-        for j in range(lst_day_out[i] + 1):
-            if j == lst_day_out[i]:
-                admitted_beds[i] = admitted_beds[i] + lst_outcome[i]
-                available_beds.append(admitted_beds[i])
-
-    return available_beds, x_num_days
+    ledger = BedLedger(0, number_of_days)
+    ledger.discharge(lst_day_out, lst_outcome)
+    available_beds = (np.asarray(admitted_beds, dtype=float) - ledger.occupancy).tolist()
+    return available_beds, list(range(number_of_days))
 
 
 def test_result_days(lst_day: list, lst_time_to_outcome: list, number_of_days: int, new_days: list, lst_outcome: list, lst_day_out: list, lst_hospitalized: list, number_of_beds: int) -> tuple:
     """
-        This function creates two lists of the number of days after which testing results are received and the number of days after which recovered/dead patients are discharged
-        :param lst_day: List of nth days after which test result are coming out
+        This function creates two lists of the day on which testing results are received and the day on which recovered/dead patients are discharged
+        :param lst_day: List of number of days after which test result are coming out, for each day in simulation
         :param lst_time_to_outcome: The nth day after which outcome is witnessed with respect to the admitted day
         :param number_of_days: Number of days to test the simulation
-        :param new_days: List of number of days for each day in simulation, after which the test result are arriving
+        :param new_days: List of the day on which the test result are arriving, for each day in simulation
         :param lst_outcome: List of number of patients with some outcome. Either recovered or dead
-        :param lst_day_out: List of number of days for each day in simulation, after which the outcome is recieved
+        :param lst_day_out: List of the day on which the outcome is recieved, for each day in simulation
         :param lst_hospitalized: List of number of patients to be hospitalized
         :param number_of_beds: Number of hospital beds available in simulation
         :return: avail_beds: List of available beds on a given day based on the admitted patients and outcome (recovered/dead) patients,
                      num_days: The days to be plotted on x-axis in the graph
 
-        >>> test_result_days([2, 3], [6, 7], 2, [5,10],[40,28], [23,33], [10, 5], 500)
-        ([530, 513], [0, 1])
+        >>> test_result_days([1, 1], [1, 7], 3, [], [4, 2], [], [10, 5], 500)
+        ([500.0, 490.0, 489.0], [0, 1, 2])
         """
-    new_days = []
-    lst_day_out = []
-    for k in range(len(lst_day)):
-        day = k
-        day = day + lst_day[k]
-        day_out = day + lst_time_to_outcome[k]
-        new_days.append(day)
-        lst_day_out.append(day_out)
+    new_days = np.arange(len(lst_day)) + np.asarray(lst_day, dtype=np.int64)
+    lst_day_out = new_days + np.asarray(lst_time_to_outcome, dtype=np.int64)
     avail_beds, num_days = admitted_bed(number_of_days, new_days, lst_outcome, lst_day_out, lst_hospitalized, number_of_beds)
     return avail_beds, num_days
 
@@ -243,86 +748,1658 @@ def model(simulation_id: int, number_of_days: int, population: int, total_beds:
     new_days = []
     lst_hospitalized = []
 
-    for i in range(number_of_days):
-        susceptible = susceptible - int(Variables.s_e())*infected*susceptible
-        incub_rate, arr_rate, prob_pos, test_result_time = Variables.e_i()
-        exposed = (Variables.s_e() * susceptible - incub_rate * exposed)*0.05  # People getting exposed after social distancing - https://github.com/covid19-bh-biostats/seir/blob/master/SEIR/model_configs/basic
-        day = day + test_result_time
-        infected = arr_rate * prob_pos * exposed
-        hospitalized = int(infected*(17/100))  # People who require hospitalization - https://gis.cdc.gov/grasp/covidnet/COVID19_3.html ; https://en.as.com/en/2020/04/12/other_sports/1586725810_541498.html
-        lst_hospitalized.append(hospitalized)
-        outcome_time, rate_outcome = Variables.i_r()
-        outcome = rate_outcome * hospitalized
-        lst_outcome.append(outcome)
-        lst_day.append(test_result_time)
-        lst_time_to_outcome.append(outcome_time)
-    bed_count, num_days = test_result_days(lst_day, lst_time_to_outcome, number_of_days, new_days, lst_outcome, lst_day_out, lst_hospitalized, number_of_beds)
+    PROFILER.count('simulations')
+    with PROFILER.stage('model'):
+        for i in range(number_of_days):
+            susceptible = susceptible - int(Variables.s_e())*infected*susceptible
+            incub_rate, arr_rate, prob_pos, test_result_time = Variables.e_i()
+            exposed = (Variables.s_e() * susceptible - incub_rate * exposed)*0.05  # People getting exposed after social distancing - https://github.com/covid19-bh-biostats/seir/blob/master/SEIR/model_configs/basic
+            day = day + test_result_time
+            infected = arr_rate * prob_pos * exposed
+            hospitalized = int(infected*(17/100))  # People who require hospitalization - https://gis.cdc.gov/grasp/covidnet/COVID19_3.html ; https://en.as.com/en/2020/04/12/other_sports/1586725810_541498.html
+            lst_hospitalized.append(hospitalized)
+            outcome_time, rate_outcome = Variables.i_r()
+            outcome = rate_outcome * hospitalized
+            lst_outcome.append(outcome)
+            lst_day.append(test_result_time)
+            lst_time_to_outcome.append(outcome_time)
+    with PROFILER.stage('ledger'):
+        bed_count, num_days = test_result_days(lst_day, lst_time_to_outcome, number_of_days, new_days, lst_outcome, lst_day_out, lst_hospitalized, number_of_beds)
 
     return bed_count, num_days
 
 
-def simulation(number_of_days: int, number_of_simulation: int, population: int, total_beds: int, do_threading=True):
+def simulation_stream(seed: int, simulation_id: int) -> np.random.Generator:
+    """
+        Random stream of one simulation, derived from the master seed and the simulation ID only
+        :param seed: Master seed of the run
+        :param simulation_id: ID of the simulation
+        :return: Random number generator of the simulation
+        >>> float(simulation_stream(1, 5).random()) == float(simulation_stream(1, 5).random())
+        True
+        """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(simulation_id,)))
+
+
+def model_batch(number_of_simulation: int, number_of_days: int, population: int, total_beds: int, simulation_ids=None, seed: int = None, strategy: str = 'plain') -> tuple:
+    """
+        Vectorised version of model() which runs every simulation at once on (number_of_simulation, number_of_days) arrays
+        All the transitional variables of the class Variables are drawn in one go for every simulation and day,
+        the compartments are then advanced one day at a time for all simulations together
+        :param number_of_simulation: Total number of simulations to run
+        :param number_of_days: Number of days for which the simulation has to run
+        :param population: General population of the region considered
+        :param total_beds: Total number of hospital beds available in the region considered
+        :param simulation_ids: IDs of the simulations, 0 to number_of_simulation - 1 when None
+        :param seed: Master seed, each simulation then uses its own random stream from simulation_stream()
+        :param strategy: Sampling strategy of the draws, one of SAMPLING_STRATEGIES
+        :return: bed_count: Array of available beds of shape (number_of_simulation, number_of_days),
+                    num_days: The days to be plotted on x-axis in the graph
+        >>> beds, days = model_batch(3, 2, 200, 100)
+        >>> beds.tolist(), days
+        ([[100.0, 100.0], [100.0, 100.0], [100.0, 100.0]], [0, 1])
+        """
+    # Same distributions as Variables.s_e(), Variables.e_i() and Variables.i_r(), one draw per simulation and day
+    draws = Variables.draw_batch(number_of_simulation, number_of_days, simulation_ids, seed, strategy)
+    ledger = model_ledger(draws, population, total_beds)
+    return ledger.available, list(range(number_of_days))
+
+
+def advance_compartments(draws: np.ndarray, susceptible: np.ndarray, exposed: np.ndarray, infected: np.ndarray) -> tuple:
+    """
+        Advances the compartments of a block of simulations one day at a time over the days of the draws
+        :param draws: Draws of every daily variable, shape (8, number_of_simulation, number_of_days), see Variables.draw_batch()
+        :param susceptible: Susceptible people of each simulation before the first day
+        :param exposed: Exposed people of each simulation before the first day
+        :param infected: Infected people of each simulation before the first day
+        :return: hospitalized: Array of people hospitalized on each day, shape (number_of_simulation, number_of_days),
+                    compartments: Susceptible, exposed and infected people after the last day
+        >>> hospitalized, compartments = advance_compartments(Variables.draw_batch(2, 3, seed=1), np.full(2, 200.0), np.ones(2), np.zeros(2))
+        >>> hospitalized.tolist()
+        [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+        """
+    susceptible_rate = 1.0 / draws[0]
+    infectious_rate = 1.0 / draws[1]
+    incub_rate = 1.0 / draws[2]
+    arr_rate = draws[3]
+    prob_pos = draws[4]
+    # concept of compartments - https://www.datahubbs.com/social-distancing-to-slow-the-coronavirus/
+    with PROFILER.stage('model'):
+        hospitalized = np.empty(draws.shape[1:])
+        for i in range(draws.shape[2]):
+            susceptible = susceptible - np.trunc(susceptible_rate[:, i]) * infected * susceptible
+            exposed = (infectious_rate[:, i] * susceptible - incub_rate[:, i] * exposed) * 0.05
+            infected = arr_rate[:, i] * prob_pos[:, i] * exposed
+            hospitalized[:, i] = np.trunc(infected * (17 / 100))
+    return hospitalized, (susceptible, exposed, infected)
+
+
+def model_ledger(draws: np.ndarray, population: int, total_beds) -> BedLedger:
+    """
+        Advances the compartments of a block of simulations and books their admissions and discharges
+        :param draws: Draws of every daily variable, shape (8, number_of_simulation, number_of_days), see Variables.draw_batch()
+        :param population: General population of the region considered, a single number or one per simulation
+        :param total_beds: Total number of hospital beds available in the region considered, a single number or one per simulation
+        :return: ledger: Bed ledger of the simulations
+        >>> model_ledger(Variables.draw_batch(2, 3, seed=1), 200, 100).occupancy.tolist()
+        [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+        """
+    number_of_simulation, number_of_days = draws.shape[1:]
+    PROFILER.count('simulations', number_of_simulation)
+    compartments = (np.zeros(number_of_simulation) + population, np.ones(number_of_simulation), np.zeros(number_of_simulation))
+    hospitalized, compartments = advance_compartments(draws, *compartments)
+    outcome = 1.0 / draws[7] * hospitalized
+
+    # Same bookkeeping as test_result_days(): admission on the test result day, discharge on the outcome day
+    with PROFILER.stage('ledger'):
+        new_days = np.arange(number_of_days) + np.trunc(draws[5]).astype(np.int64)
+        lst_day_out = new_days + np.trunc(draws[6]).astype(np.int64)
+        ledger = BedLedger(total_beds, number_of_days, number_of_simulation)
+        ledger.admit(new_days, hospitalized)
+        ledger.discharge(lst_day_out, outcome)
+    return ledger
+
+
+class BatchState:
+    """
+        State of a block of seeded simulations after their last day, from which model_extend() continues them to a longer
+        horizon without drawing or advancing the first days again: the compartments, the beds occupied, the admissions
+        and discharges booked after the last day and the position of the random stream of each simulation
+        """
+    def __init__(self, simulation_ids, seed: int, number_of_days: int, compartments: tuple, occupancy: np.ndarray, admissions: np.ndarray,
+                 discharges: np.ndarray, streams: list):
+        """
+        :param simulation_ids: IDs of the simulations
+        :param seed: Master seed of the random streams
+        :param number_of_days: Number of days simulated so far
+        :param compartments: Susceptible, exposed and infected people of each simulation after the last day
+        :param occupancy: Beds occupied in each simulation at the end of the last day
+        :param admissions: Patients admitted on each of the next days, shape (number_of_simulation, days booked ahead)
+        :param discharges: Patients discharged on each of the next days, same shape as admissions
+        :param streams: State of the random stream of each simulation
+        """
+        self.simulation_ids = list(simulation_ids)
+        self.seed = seed
+        self.number_of_days = number_of_days
+        self.compartments = compartments
+        self.occupancy = occupancy
+        self.admissions = admissions
+        self.discharges = discharges
+        self.streams = streams
+
+
+def model_extend(number_of_days: int, population: int, total_beds: int, seed: int, simulation_ids=None, state: BatchState = None) -> tuple:
+    """
+        Seeded version of model_batch() which can be continued: runs a block of simulations up to number_of_days, from
+        day 0 or from the state of an earlier call with a shorter horizon. The result is the same as a single model_batch()
+        call with the same seed, as every simulation draws its days in order from its own random stream
+        :param number_of_days: Number of days for which the simulation has to run, in total
+        :param population: General population of the region considered
+        :param total_beds: Total number of hospital beds available in the region considered
+        :param seed: Master seed, each simulation then uses its own random stream from simulation_stream()
+        :param simulation_ids: IDs of the simulations to start, needed without a state; those of the state are continued
+        :param state: State of the simulations after an earlier call, None to start from day 0
+        :return: bed_count: Array of available beds of the days not simulated yet, shape (number_of_simulation, number_of_days - state.number_of_days),
+                    state: State of the simulations after number_of_days
+        >>> first_days, state = model_extend(30, 2710000, 33000, seed=1, simulation_ids=range(5))
+        >>> next_days, state = model_extend(60, 2710000, 33000, seed=1, state=state)
+        >>> bool((np.hstack([first_days, next_days]) == model_batch(5, 60, 2710000, 33000, seed=1)[0]).all()), state.number_of_days
+        (True, 60)
+        >>> model_extend(30, 2710000, 33000, seed=1)
+        Traceback (most recent call last):
+        ...
+        ValueError: simulation_ids are needed to start simulations without a state.
+        """
+    samplers = Variables.batch_samplers()
+    if state is None and simulation_ids is None:
+        raise ValueError('simulation_ids are needed to start simulations without a state.')
+    first_day = 0 if state is None else state.number_of_days
+    simulation_ids = list(simulation_ids) if state is None else state.simulation_ids
+    number_of_simulation, days = len(simulation_ids), number_of_days - first_day
+    if days <= 0:
+        raise ValueError('the simulations already cover %d days, not fewer than %d.' % (first_day, number_of_days))
+    # Admissions and discharges fall at most this many days after the day of the infection
+    ahead = int(Variables.test_result_time.maximum) + int(Variables.time_to_outcome.maximum) + 1
+
+    # Same draws as Variables.draw_batch(), continued from where each stream stopped
+    PROFILER.count('random_draws', len(samplers) * number_of_simulation * days)
+    with PROFILER.stage('variables'):
+        streams = [simulation_stream(seed, simulation_id) for simulation_id in simulation_ids]
+        if state is not None:
+            for stream, position in zip(streams, state.streams):
+                stream.bit_generator.state = position
+        draws = Variables.draw_streams(streams, days)
+        streams = [stream.bit_generator.state for stream in streams]
+
+    PROFILER.count('simulations', number_of_simulation)
+    if state is None:
+        compartments = (np.zeros(number_of_simulation) + population, np.ones(number_of_simulation), np.zeros(number_of_simulation))
+        occupancy = np.zeros(number_of_simulation)
+        booked = np.zeros((2, number_of_simulation, ahead))
+    else:
+        compartments, occupancy, booked = state.compartments, state.occupancy, np.stack([state.admissions, state.discharges])
+    hospitalized, compartments = advance_compartments(draws, *compartments)
+    outcome = 1.0 / draws[7] * hospitalized
+
+    # Same bookkeeping as model_ledger(), on a calendar of the new days and the days booked ahead. The bookings carried
+    # over come first in each slot, so each day adds up its patients in the same order as in a single call
+    with PROFILER.stage('ledger'):
+        width = days + ahead
+        rows = np.arange(number_of_simulation)[:, None] * width
+        new_days = np.arange(days) + np.trunc(draws[5]).astype(np.int64)
+        lst_day_out = new_days + np.trunc(draws[6]).astype(np.int64)
+        carried = (rows + np.arange(ahead)).ravel()
+        calendars = [np.bincount(np.concatenate((carried, (rows + day).ravel())), weights=np.concatenate((before.ravel(), patients.ravel())),
+                                 minlength=number_of_simulation * width).reshape(number_of_simulation, width)
+                     for before, day, patients in ((booked[0], new_days, hospitalized), (booked[1], lst_day_out, outcome))]
+        occupancy = np.cumsum(np.column_stack((occupancy, calendars[0][:, :days] - calendars[1][:, :days])), axis=1)[:, 1:]
+    state = BatchState(simulation_ids, seed, number_of_days, compartments, occupancy[:, -1], calendars[0][:, days:], calendars[1][:, days:], streams)
+    return total_beds - occupancy, state
+
+
+def beds_outcome(bed_count: np.ndarray, total_beds: int) -> tuple:
+    """
+        Computes the overflow day and the percentage of vacant beds for every row of a bed count array
+        :param bed_count: Array of available beds of shape (number_of_simulation, number_of_days)
+        :param total_beds: Total number of hospital beds available in the region considered
+        :return: overflow_day: the nth day on which the hospital beds overflow, for the simulations that overflow,
+                    perc_vacant_beds: percentage of vacant beds by the end of each simulation
+        >>> overflow_day, perc_vacant_beds = beds_outcome(np.array([[5, -1, 2], [4, 3, 2]]), 4)
+        >>> overflow_day.tolist(), perc_vacant_beds.tolist()
+        ([1], [50.0, 50.0])
+        """
+    with PROFILER.stage('postprocess'):
+        last_day = bed_count[:, -1]
+        perc_vacant_beds = np.where(last_day < 0, 0, last_day * 1.0 / total_beds) * 100
+        overflowing = bed_count < 0
+        has_overflow = overflowing.any(axis=1)
+        overflow_day = overflowing.argmax(axis=1)[has_overflow]
+    return overflow_day, perc_vacant_beds
+
+
+class SimulationSummary:
+    """
+        Statistics of a run which are updated as each simulation or block of simulations finishes
+        Memory depends on the number of days only: per-day mean and variance, per-day histograms of available beds
+        for approximate percentiles, the overflow-day histogram, the vacant-bed histogram and the overflow probability
+        Full trajectories are kept only when keep_trajectories is set, a fixed-size random sample of them when sample_size is set
+        >>> summary = SimulationSummary(3, 10)
+        >>> summary.update(np.array([[10, 5, -2], [10, 8, 6]]))
+        >>> summary.update(np.array([10, 4, 2]))
+        >>> summary.count, summary.mean.tolist(), summary.overflow_probability
+        (3, [10.0, 5.666666666666667, 2.0], 0.3333333333333333)
+        >>> summary.overflow_days.tolist(), summary.variance.round(2).tolist()
+        ([0, 0, 1], [0.0, 4.33, 16.0])
+        >>> summary.percentile(50).round().tolist()
+        [10.0, 5.0, 2.0]
+        >>> edge = SimulationSummary(3, 1)
+        >>> edge.update(np.array([1, 1, -50]))
+        >>> edge.update(np.array([1, 1, np.nextafter(edge.bed_edges[-1], -np.inf)]))
+        >>> edge.bed_histogram.sum(axis=1).tolist(), int(edge.bed_histogram[-1, -1])
+        ([2, 2, 2], 1)
+        >>> sampled = SimulationSummary(2, 10, sample_size=3, seed=1)
+        >>> for beds in range(10):
+        ...     sampled.update(np.array([[10, beds]]))
+        >>> sampled.sample.shape
+        (3, 2)
+        """
+    def __init__(self, number_of_days: int, total_beds: int, bins: int = 1024, keep_trajectories: bool = False, sample_size: int = 0, seed: int = None):
+        """
+        :param number_of_days: Number of days for which the simulation has to run
+        :param total_beds: Total hospital beds available in the region considered
+        :param bins: Number of bins of the per-day histograms used for the percentiles, must be even
+        :param keep_trajectories: Keep every trajectory in memory as well
+        :param sample_size: Number of trajectories kept in a uniform random sample of all of them
+        :param seed: Seed of the random sample
+        """
+        self.number_of_days = number_of_days
+        self.total_beds = total_beds
+        self.bins = bins
+        self.count = 0
+        self.mean = np.zeros(number_of_days)
+        self._m2 = np.zeros(number_of_days)
+        self.overflow_days = np.zeros(number_of_days, dtype=np.int64)
+        # 1% wide bins of the percentage of vacant beds
+        self.vacant_beds_edges = np.linspace(0, 100, 101)
+        self.vacant_beds_histogram = np.zeros(100, dtype=np.int64)
+        self._vacant_beds_sum = 0.0
+        self._vacant_beds_squares = 0.0
+        self._bed_histogram = np.zeros((number_of_days, bins), dtype=np.int64)
+        self._lower = None
+        self._width = None
+        self._trajectories = [] if keep_trajectories else None
+        self.sample_size = sample_size
+        self.sample = np.empty((0, number_of_days))
+        self._sample_rng = np.random.default_rng(seed)
+
+    def _cover(self, low: float, high: float):
+        """
+        Doubles the width of the bins of the per-day histograms until they cover low to high
+        :param low: Lowest number of available beds to cover
+        :param high: Highest number of available beds to cover
+        """
+        if self._lower is None:
+            self._lower = low
+            self._width = max(high - low, 1.0) / (self.bins - 1)
+        half = self.bins // 2
+        while low < self._lower or high >= self._lower + self.bins * self._width:
+            merged = self._bed_histogram.reshape(self.number_of_days, half, 2).sum(axis=2)
+            empty = np.zeros_like(merged)
+            if low < self._lower:
+                self._bed_histogram = np.concatenate((empty, merged), axis=1)
+                self._lower -= self.bins * self._width
+            else:
+                self._bed_histogram = np.concatenate((merged, empty), axis=1)
+            self._width *= 2
+
+    def update(self, bed_count: np.ndarray):
+        """
+        Adds finished simulations to the statistics
+        :param bed_count: Available beds of one simulation, or array of shape (simulations, number_of_days)
+        """
+        with PROFILER.stage('aggregate'):
+            self._update(bed_count)
+
+    def _update(self, bed_count: np.ndarray):
+        """
+        Statistics part of update()
+        """
+        bed_count = np.asarray(bed_count, dtype=float).reshape(-1, self.number_of_days)
+        number_of_simulation = len(bed_count)
+        if number_of_simulation == 0:
+            return
+
+        # Per-day mean and variance, merged with the previous simulations (Chan et al.)
+        batch_mean = bed_count.mean(axis=0)
+        batch_m2 = ((bed_count - batch_mean) ** 2).sum(axis=0)
+        total = self.count + number_of_simulation
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * number_of_simulation / total
+        self._m2 = self._m2 + batch_m2 + delta ** 2 * self.count * number_of_simulation / total
+        self.count = total
+
+        self._cover(bed_count.min(), bed_count.max())
+        # Rounding can put a value just below the upper edge into the bin past the last one
+        slots = np.clip((bed_count - self._lower) // self._width, 0, self.bins - 1).astype(np.int64) + np.arange(self.number_of_days) * self.bins
+        self._bed_histogram += np.bincount(slots.ravel(), minlength=self._bed_histogram.size).reshape(self._bed_histogram.shape)
+
+        overflow_day, perc_vacant_beds = beds_outcome(bed_count, self.total_beds)
+        self.overflow_days += np.bincount(overflow_day, minlength=self.number_of_days)
+        self.vacant_beds_histogram += np.histogram(perc_vacant_beds, self.vacant_beds_edges)[0]
+        self._vacant_beds_sum += perc_vacant_beds.sum()
+        self._vacant_beds_squares += (perc_vacant_beds ** 2).sum()
+
+        if self._trajectories is not None:
+            self._trajectories.append(bed_count)
+        if self.sample_size:
+            self._update_sample(bed_count)
+
+    def _update_sample(self, bed_count: np.ndarray):
+        """
+        Reservoir sampling of the trajectories: after n simulations, each of them is in the sample with probability sample_size / n
+        :param bed_count: Array of available beds of the simulations just added
+        """
+        seen = self.count - len(bed_count)
+        room = max(self.sample_size - len(self.sample), 0)
+        self.sample = np.concatenate((self.sample, bed_count[:room]))
+        if room < len(bed_count):
+            positions = seen + np.arange(room, len(bed_count))
+            slots = self._sample_rng.integers(0, positions + 1)
+            chosen = slots < self.sample_size
+            self.sample[slots[chosen]] = bed_count[room:][chosen]
+
+    @property
+    def bed_edges(self) -> np.ndarray:
+        """Edges of the bins of the per-day histograms of available beds"""
+        return self._lower + np.arange(self.bins + 1) * self._width
+
+    @property
+    def bed_histogram(self) -> np.ndarray:
+        """Per-day histograms of available beds, shape (number_of_days, bins)"""
+        return self._bed_histogram
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Per-day sample variance of the available beds"""
+        return self._m2 / max(self.count - 1, 1)
+
+    @property
+    def overflow_probability(self) -> float:
+        """Fraction of the simulations in which the beds overflow"""
+        return self.overflow_days.sum() / self.count if self.count else 0.0
+
+    @property
+    def overflow_day_mean(self) -> float:
+        """Mean overflow day of the simulations in which the beds overflow"""
+        overflowed = self.overflow_days.sum()
+        return (self.overflow_days * np.arange(self.number_of_days)).sum() / overflowed if overflowed else np.nan
+
+    @property
+    def overflow_day_variance(self) -> float:
+        """Sample variance of the overflow day of the simulations in which the beds overflow"""
+        overflowed = self.overflow_days.sum()
+        if overflowed < 2:
+            return np.nan
+        return (self.overflow_days * (np.arange(self.number_of_days) - self.overflow_day_mean) ** 2).sum() / (overflowed - 1)
+
+    @property
+    def vacant_beds_mean(self) -> float:
+        """Mean percentage of vacant beds by the end of the simulations"""
+        return self._vacant_beds_sum / self.count if self.count else np.nan
+
+    @property
+    def vacant_beds_variance(self) -> float:
+        """Sample variance of the percentage of vacant beds by the end of the simulations"""
+        if self.count < 2:
+            return np.nan
+        return max(self._vacant_beds_squares - self.count * self.vacant_beds_mean ** 2, 0.0) / (self.count - 1)
+
+    def intervals(self, z: float = 1.96) -> dict:
+        """
+        Confidence intervals of the overflow probability (Wilson score interval), the mean overflow day and the mean
+        percentage of vacant beds by the end of the simulations, infinite while there are too few simulations
+        :param z: z-score of the intervals, 1.96 for 95% confidence
+        :return: Low and high end of each interval
+        >>> summary = SimulationSummary(2, 10)
+        >>> summary.update(np.array([[5, -1], [4, 3], [6, -2], [4, 5]]))
+        >>> {name: np.round(interval, 3).tolist() for name, interval in summary.intervals().items()}
+        {'overflow_probability': [0.15, 0.85], 'overflow_day': [1.0, 1.0], 'vacant_beds': [-4.005, 44.005]}
+        """
+        intervals = {}
+        n = self.count
+        if n:
+            p = self.overflow_probability
+            centre = (p + z ** 2 / (2 * n)) / (1 + z ** 2 / n)
+            half_width = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / (1 + z ** 2 / n)
+            intervals['overflow_probability'] = (centre - half_width, centre + half_width)
+        else:
+            intervals['overflow_probability'] = (0.0, 1.0)
+        for name, mean, variance, size in (('overflow_day', self.overflow_day_mean, self.overflow_day_variance, self.overflow_days.sum()),
+                                           ('vacant_beds', self.vacant_beds_mean, self.vacant_beds_variance, n)):
+            if np.isnan(variance):
+                intervals[name] = (-np.inf, np.inf)
+            else:
+                half_width = z * np.sqrt(variance / size)
+                intervals[name] = (mean - half_width, mean + half_width)
+        return intervals
+
+    @property
+    def trajectories(self):
+        """Array of all the trajectories, None when they are not kept"""
+        if self._trajectories is None:
+            return None
+        return np.concatenate(self._trajectories) if self._trajectories else np.empty((0, self.number_of_days))
+
+    def percentile(self, q: float) -> np.ndarray:
+        """
+        Approximate per-day percentile of the available beds, accurate to the width of a histogram bin
+        :param q: Percentile between 0 and 100
+        :return: Array of the percentile of each day
+        """
+        cumulative = np.cumsum(self._bed_histogram, axis=1)
+        target = q / 100 * self.count
+        index = np.minimum((cumulative < target).sum(axis=1), self.bins - 1)
+        days = np.arange(self.number_of_days)
+        before = np.where(index > 0, cumulative[days, np.maximum(index - 1, 0)], 0)
+        in_bin = self._bed_histogram[days, index]
+        fraction = np.where(in_bin > 0, (target - before) / np.maximum(in_bin, 1), 0.5)
+        return self._lower + (index + np.clip(fraction, 0, 1)) * self._width
+
+
+def available_cpus() -> int:
+    """
+        :return: Number of CPU cores this process is allowed to run on
+        >>> available_cpus() >= 1
+        True
+        """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def shared_directory(size: int, directory: str = '/dev/shm'):
+    """
+        Directory of the files shared with the worker processes: the in-memory directory when it exists and has room
+        :param size: Number of bytes of the file
+        :param directory: In-memory directory
+        :return: directory, or None for the default temporary directory
+        >>> shared_directory(0, '/no/such/directory') is None
+        True
+        """
+    try:
+        stats = os.statvfs(directory)
+    except (AttributeError, OSError):
+        return None
+    return directory if stats.f_bavail * stats.f_frsize >= size else None
+
+
+class _NoProgress:
+    """Progress bar which shows nothing, used when progress is off so that tqdm is not imported"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, n: int = 1):
+        pass
+
+
+_NO_PROGRESS = _NoProgress()
+
+
+def progress_bar(total: int, enabled: bool = True, initial: int = 0):
+    """
+    :param total: Number of steps
+    :param enabled: Show the progress bar
+    :param initial: Number of steps already done
+    :return: tqdm progress bar, one which shows nothing when not enabled
+    >>> with progress_bar(10, enabled=False) as bar:
+    ...     bar.update(10)
+    """
+    if not enabled:
+        return _NO_PROGRESS
+    from tqdm import tqdm
+    return tqdm(total=total, initial=initial)
+
+
+def _profiled_task(call: tuple) -> tuple:
+    """
+        Runs a worker task of SimulationExecutor.map(), with the worker's Profiler switched on when the parent's is
+        :param call: Task function, its argument and whether the parent's Profiler is enabled
+        :return: Result of the task and the records of the worker's Profiler, None when disabled
+        """
+    function, task, enabled = call
+    PROFILER.enabled = enabled
+    if not enabled:
+        return function(task), None
+    PROFILER.reset()
+    start = time.perf_counter()
+    result = function(task)
+    PROFILER.workers[os.getpid()] = {'tasks': 1, 'simulations': PROFILER.counters.get('simulations', 0), 'seconds': time.perf_counter() - start}
+    return result, PROFILER.snapshot()
+
+
+def _run_chunk(task: tuple) -> int:
+    """
+        Worker task of SimulationExecutor, runs one block of simulation IDs and writes it into the shared array
+        :param task: path and shape of the shared array, first and last + 1 simulation ID, population, total beds and seed
+        :return: Number of simulations done
+        """
+    path, shape, start, stop, population, total_beds, seed = task
+    bed_count, days = model_batch(stop - start, shape[1], population, total_beds, range(start, stop), seed)
+    beds = np.memmap(path, dtype=np.float64, mode='r+', shape=shape)
+    beds[start:stop] = bed_count
+    beds.flush()
+    del beds
+    return stop - start
+
+
+def _run_chunk_array(task: tuple) -> tuple:
+    """
+        Worker task of SimulationExecutor.imap(), runs one block of simulation IDs and sends its trajectories back
+        :param task: number of days, first and last + 1 simulation ID, population, total beds, seed and sampling strategy
+        :return: First simulation ID of the block and its array of available beds
+        """
+    number_of_days, start, stop, population, total_beds, seed, strategy = task
+    bed_count, days = model_batch(stop - start, number_of_days, population, total_beds, range(start, stop), seed, strategy)
+    return start, bed_count
+
+
+def _run_extend_chunk(task: tuple) -> tuple:
+    """
+    Runs or continues a block of seeded simulations with model_extend() in a worker process
+    :param task: Number of days, population, total beds, seed, and the IDs of a new block or the BatchState of a block to continue
+    :return: Array of available beds of the new days and state of the block
+    """
+    number_of_days, population, total_beds, seed, block = task
+    if isinstance(block, BatchState):
+        return model_extend(number_of_days, population, total_beds, seed, state=block)
+    return model_extend(number_of_days, population, total_beds, seed, simulation_ids=block)
+
+
+class SimulationExecutor:
+    """
+        Process pool which runs blocks of simulation IDs with model_batch()
+        Workers write their trajectories straight into a preallocated memory-mapped array shared with the parent, so only
+        the number of finished simulations is sent back. Each simulation uses its own random stream derived from the
+        master seed, so a run gives the same results whatever the number of workers or the chunk size
+        >>> with SimulationExecutor(processes=2) as executor:
+        ...     small_chunks = executor.run(3, 5, 2710000, 33000, seed=1, chunk_size=1, progress=False)
+        ...     large_chunks = executor.run(3, 5, 2710000, 33000, seed=1, chunk_size=4, progress=False)
+        >>> bool((small_chunks == large_chunks).all()), bool((small_chunks == model_batch(5, 3, 2710000, 33000, seed=1)[0]).all())
+        (True, True)
+        """
+    def __init__(self, processes: int = None):
+        """
+        :param processes: Number of worker processes, all the available cores when None
+        """
+        self.processes = processes or available_cpus()
+        self._pool = None
+
+    @property
+    def pool(self) -> Pool:
+        """The worker pool, started on first use"""
+        if self._pool is None:
+            self._pool = Pool(processes=self.processes)
+        return self._pool
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def map(self, function, tasks):
+        """
+        Runs the tasks on the pool, in any order
+        When PROFILER is enabled, the records of the workers are merged into it, with the bytes sent and received
+        :param function: Module-level worker function
+        :param tasks: Argument of each call
+        :return: Generator of the results
+        """
+        enabled = PROFILER.enabled
+        calls = []
+        for task in tasks:
+            if enabled:
+                PROFILER.count('ipc_bytes_sent', len(pickle.dumps(task)))
+            calls.append((function, task, enabled))
+        results = self.pool.imap_unordered(_profiled_task, calls)
+        while True:
+            with PROFILER.stage('pool'):
+                try:
+                    result, snapshot = next(results)
+                except StopIteration:
+                    return
+            if snapshot is not None:
+                PROFILER.merge(snapshot)
+                PROFILER.count('ipc_bytes_received', len(pickle.dumps((result, snapshot))))
+            yield result
+
+    def chunk_size(self, number_of_simulation: int, strategy: str = 'plain') -> int:
+        """
+        :param number_of_simulation: Total number of simulations of the run
+        :param strategy: Sampling strategy of the run, one of SAMPLING_STRATEGIES
+        :return: Number of simulations per task, about 4 tasks per worker, a multiple of STRATIFICATION_BLOCK for the
+                 strategies other than plain so that no block is drawn by two tasks
+        >>> SimulationExecutor(processes=4).chunk_size(1000), SimulationExecutor(processes=4).chunk_size(1000, 'sobol')
+        (63, 256)
+        """
+        chunk_size = max(1, min(4096, -(-number_of_simulation // (self.processes * 4))))
+        if strategy != 'plain':
+            chunk_size = -(-chunk_size // STRATIFICATION_BLOCK) * STRATIFICATION_BLOCK
+        return chunk_size
+
+    def run(self, number_of_days: int, number_of_simulation: int, population: int, total_beds: int, seed: int, chunk_size: int = None, progress: bool = True) -> np.ndarray:
+        """
+        Runs all the simulations on the pool
+        :param number_of_days: Number of days for which the simulation has to run
+        :param number_of_simulation: Total number of simulations
+        :param population: Population in the region considered
+        :param total_beds: Total hospital beds available in the region considered
+        :param seed: Master seed of the random streams
+        :param chunk_size: Number of simulations per task, chosen from the number of workers when None
+        :param progress: Show a progress bar
+        :return: Array of available beds of shape (number_of_simulation, number_of_days)
+        """
+        chunk_size = chunk_size or self.chunk_size(number_of_simulation)
+        shape = (number_of_simulation, number_of_days)
+        size = number_of_simulation * number_of_days * np.dtype(np.float64).itemsize
+        handle, path = tempfile.mkstemp(suffix='.beds', dir=shared_directory(size))
+        try:
+            # Reserving the space now raises an error when it is missing, instead of the workers failing with SIGBUS
+            reserved = hasattr(os, 'posix_fallocate') and size > 0
+            try:
+                if reserved:
+                    os.posix_fallocate(handle, 0, size)
+            finally:
+                os.close(handle)
+            beds = np.memmap(path, dtype=np.float64, mode='r+' if reserved else 'w+', shape=shape)
+            tasks = [(path, shape, start, min(start + chunk_size, number_of_simulation), population, total_beds, seed)
+                     for start in range(0, number_of_simulation, chunk_size)]
+            with progress_bar(number_of_simulation, progress) as bar:
+                for done in self.map(_run_chunk, tasks):
+                    bar.update(done)
+            bed_count = np.array(beds)
+            del beds
+        finally:
+            os.remove(path)
+        return bed_count
+
+    def imap(self, number_of_days: int, number_of_simulation: int, population: int, total_beds: int, seed: int, chunk_size: int = None, first_simulation_id: int = 0, strategy: str = 'plain'):
+        """
+        Runs all the simulations on the pool and yields each block as soon as it is finished, in any order
+        Only the blocks waiting to be consumed are held in memory, not the whole run
+        :param number_of_days: Number of days for which the simulation has to run
+        :param number_of_simulation: Total number of simulations
+        :param population: Population in the region considered
+        :param total_beds: Total hospital beds available in the region considered
+        :param seed: Master seed of the random streams
+        :param chunk_size: Number of simulations per task, chosen from the number of workers when None
+        :param first_simulation_id: ID of the first simulation, to continue an earlier run
+        :param strategy: Sampling strategy within each block, one of SAMPLING_STRATEGIES
+        :return: Generator of the first simulation ID and the array of available beds of each block
+        """
+        chunk_size = chunk_size or self.chunk_size(number_of_simulation, strategy)
+        last_simulation_id = first_simulation_id + number_of_simulation
+        tasks = ((number_of_days, start, min(start + chunk_size, last_simulation_id), population, total_beds, seed, strategy)
+                 for start in range(first_simulation_id, last_simulation_id, chunk_size))
+        return self.map(_run_chunk_array, tasks)
+
+    def extend(self, number_of_days: int, population: int, total_beds: int, seed: int, blocks):
+        """
+        Runs new blocks of seeded simulations, or continues earlier ones to a longer horizon, with model_extend()
+        :param number_of_days: Number of days for which the simulation has to run, in total
+        :param population: Population in the region considered
+        :param total_beds: Total hospital beds available in the region considered
+        :param seed: Master seed of the random streams
+        :param blocks: IDs of the simulations of each new block, or the BatchState of each block to continue
+        :return: Generator of the array of available beds of the new days and the state of each block, in any order
+        >>> with SimulationExecutor(processes=1) as executor:
+        ...     first_days, state = next(executor.extend(30, 2710000, 33000, 1, [range(4)]))
+        ...     next_days, state = next(executor.extend(60, 2710000, 33000, 1, [state]))
+        >>> bool((np.hstack([first_days, next_days]) == model_batch(4, 60, 2710000, 33000, seed=1)[0]).all())
+        True
+        """
+        return self.map(_run_extend_chunk, [(number_of_days, population, total_beds, seed, block) for block in blocks])
+
+
+def simulation(number_of_days: int, number_of_simulation: int, population: int, total_beds: int, do_threading=True, vectorized=False, seed: int = None, processes: int = None, chunk_size: int = None):
     """
     Simulates the defined model for the mentioned number of simulations
     :param number_of_days: Number of days for which the simulation has to run
     :param number_of_simulation: Total number of simulations specified
     :param population: Population in the region considered
     :param total_beds: Total hospital beds available in the region considered
-    :param do_threading: Boolean value
+    :param do_threading: Run blocks of simulations on a SimulationExecutor process pool
+    :param vectorized: Without do_threading, run blocks of simulations with model_batch() instead of one model() call per simulation
+    :param seed: Master seed of the run, a fresh one when None
+    :param processes: Number of worker processes with do_threading, all the available cores when None
+    :param chunk_size: Number of simulations per task with do_threading, chosen from the number of workers when None,
+                       or per model_batch() call with vectorized, 4096 when None
     :return overflow_day: the nth day on which the hospital beds will overflow,
                list_of_beds_and_days: list of tuple of available beds and days in the simulation,
                perc_vacant_beds: percentage of vacant beds by the end of the simulation
-    >>> simulation(2, 1, 500, True)
+    >>> simulation(2, 1, 500, True, processes=1)
     The Probability of vacant beds is: 0.0 %
     ([], [([1.0, 1.0], [0, 1])], [100.0])
+    >>> simulation(2, 1, 500, True, do_threading=False)
+    The Probability of vacant beds is: 0.0 %
+    ([], [([1.0, 1.0], [0, 1])], [100.0])
+    >>> simulation(2, 1, 500, True, do_threading=False, vectorized=True)
+    The Probability of vacant beds is: 0.0 %
+    ([], [([1.0, 1.0], [0, 1])], [100.0])
+    >>> simulation(60, 5, 200000, 100, do_threading=False, vectorized=True, seed=3, chunk_size=2) == simulation(60, 5, 200000, 100, do_threading=False, vectorized=True, seed=3)
+    The Probability of vacant beds is: 1.0 %
+    The Probability of vacant beds is: 1.0 %
+    True
     """
+    # Batch mode: every simulation is computed at once on 2-D arrays, model() stays as the per-simulation reference
+    if do_threading or vectorized:
+        if do_threading:
+            if seed is None:
+                seed = np.random.SeedSequence().entropy
+            with SimulationExecutor(processes) as executor:
+                blocks = [executor.run(number_of_days, number_of_simulation, population, total_beds, seed, chunk_size)]
+        else:
+            # Blocks of simulation IDs keep the draw arrays small, the draws of each simulation depend on the seed and its ID only
+            chunk_size = chunk_size or 4096
+            blocks = (model_batch(min(start + chunk_size, number_of_simulation) - start, number_of_days, population, total_beds,
+                                  range(start, min(start + chunk_size, number_of_simulation)), seed)[0]
+                      for start in range(0, number_of_simulation, chunk_size))
+        days = list(range(number_of_days))
+        overflow_day, list_of_beds_and_days, perc_vacant_beds = [], [], []
+        for bed_count in blocks:
+            block_overflow_day, block_perc_vacant_beds = beds_outcome(bed_count, total_beds)
+            overflow_day.extend(block_overflow_day.tolist())
+            perc_vacant_beds.extend(block_perc_vacant_beds.tolist())
+            # Lists as in the per-simulation path, whichever path runs
+            list_of_beds_and_days.extend((beds, days) for beds in bed_count.tolist())
+        probability = len(overflow_day) / number_of_simulation
+        print('The Probability of vacant beds is:', probability, '%')
+        return overflow_day, list_of_beds_and_days, perc_vacant_beds
+
     count = 0
     perc_vacant_beds = []
 
-    worker = partial(model, number_of_days=number_of_days, population=population, total_beds=total_beds)
-
     overflow_day = []
     list_of_beds_and_days = []
 
-    # starting Multiprocessing
-    if do_threading:
-        p = Pool(processes=4)
-        for beds_and_days in tqdm(p.imap_unordered(worker, range(number_of_simulation)), total=number_of_simulation):
-            list_of_beds_and_days.append(beds_and_days)
-
-        p.close()
-        p.join()
-
-        # Linear code without Multiprocessing
-    else:
-        for i in tqdm(range(number_of_simulation)):
+    # Linear code without Multiprocessing
+    if seed is not None:
+        np.random.seed(seed)
+        for sampler in Variables.samplers():
+            sampler.reset()
+    with progress_bar(number_of_simulation) as bar:
+        for i in range(number_of_simulation):
             beds, days = model(i, number_of_days, population, total_beds)
             list_of_beds_and_days.append((beds, days))
+            bar.update()
 
     # Hypothesis -2: -If 25% of the total population is strictly asked to follow a lockdown, 50% of the total hospital beds will become vacant.
     # This patch gives the percentage of vacant beds for the nth simulation day
 
-    for beds, days in list_of_beds_and_days:
-        if beds[-1] < 0:
-            prob_vacant = 0
-        else:
-            prob_vacant = (beds[-1] * 1.0 / total_beds)
-        perc_vacant_beds.append(prob_vacant*100)
+    with PROFILER.stage('postprocess'):
+        for beds, days in list_of_beds_and_days:
+            if beds[-1] < 0:
+                prob_vacant = 0
+            else:
+                prob_vacant = (beds[-1] * 1.0 / total_beds)
+            perc_vacant_beds.append(prob_vacant*100)
 # Hypothesis-1 : If the number of hospital beds is doubled, there will never be an overflow in the available number of beds.
 # This patch gives the day on which the number of beds hits zero and appends that day number in overflow_day list
 # which is later plotted accordingly.
 
-        for j in range(len(beds)):
-            if beds[j] < 0:
-                overflow_day.append(j)
-                count += 1
-                break
+            for j in range(len(beds)):
+                if beds[j] < 0:
+                    overflow_day.append(j)
+                    count += 1
+                    break
     probability = count / number_of_simulation
     print('The Probability of vacant beds is:', probability, '%')
     return overflow_day, list_of_beds_and_days, perc_vacant_beds
 
 
+def simulation_summary(number_of_days: int, number_of_simulation: int, population: int, total_beds: int, do_threading=True, seed: int = None, processes: int = None, chunk_size: int = None, keep_trajectories: bool = False, strategy: str = 'plain', sample_size: int = 0,
+                       executor: 'SimulationExecutor' = None, progress: bool = True) -> SimulationSummary:
+    """
+    Streaming version of simulation() which updates a SimulationSummary as each block of simulations finishes,
+    so that memory does not grow with the number of simulations
+    :param number_of_days: Number of days for which the simulation has to run
+    :param number_of_simulation: Total number of simulations specified
+    :param population: Population in the region considered
+    :param total_beds: Total hospital beds available in the region considered
+    :param do_threading: Run the blocks of simulations on a SimulationExecutor process pool
+    :param seed: Master seed of the run, a fresh one when None
+    :param processes: Number of worker processes with do_threading, all the available cores when None
+    :param chunk_size: Number of simulations per block, 4096 at most when None
+    :param keep_trajectories: Keep every trajectory in the summary as well
+    :param strategy: Sampling strategy within each block, one of SAMPLING_STRATEGIES
+    :param sample_size: Number of trajectories kept in a random sample for plotting
+    :param executor: Running SimulationExecutor to use with do_threading, left open so that it serves the next run;
+                     a new one which is closed at the end when None
+    :param progress: Show a progress bar
+    :return: summary: Statistics of the run
+    >>> summary = simulation_summary(2, 3, 500, 1, do_threading=False, seed=1, progress=False)
+    >>> summary.count, summary.overflow_probability, summary.mean.tolist()
+    (3, 0.0, [1.0, 1.0])
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    summary = SimulationSummary(number_of_days, total_beds, keep_trajectories=keep_trajectories, sample_size=sample_size, seed=seed)
+    with progress_bar(number_of_simulation, progress) as bar:
+        if do_threading:
+            owned = executor is None
+            executor = executor or SimulationExecutor(processes)
+            try:
+                for start, bed_count in executor.imap(number_of_days, number_of_simulation, population, total_beds, seed, chunk_size, strategy=strategy):
+                    summary.update(bed_count)
+                    bar.update(len(bed_count))
+            finally:
+                if owned:
+                    executor.close()
+        else:
+            chunk_size = chunk_size or 4096
+            for start in range(0, number_of_simulation, chunk_size):
+                stop = min(start + chunk_size, number_of_simulation)
+                bed_count, days = model_batch(stop - start, number_of_days, population, total_beds, range(start, stop), seed, strategy)
+                summary.update(bed_count)
+                bar.update(stop - start)
+    return summary
+
+
+def adaptive_simulation(number_of_days: int, population: int, total_beds: int, probability_precision: float = 0.01, day_precision: float = None, vacant_beds_precision: float = None,
+                        z: float = 1.96, batch_size: int = 1000, max_simulation: int = 1000000, max_seconds: float = None, do_threading=False, seed: int = None, processes: int = None,
+                        sample_size: int = 0, executor: 'SimulationExecutor' = None) -> SimulationSummary:
+    """
+    Runs batches of simulations until the confidence intervals reach the requested precision, or a budget runs out
+    Simulation IDs continue from batch to batch, so with a seed the result is the same as a fixed run of the same size
+    :param number_of_days: Number of days for which the simulation has to run
+    :param population: Population in the region considered
+    :param total_beds: Total hospital beds available in the region considered
+    :param probability_precision: Largest half-width of the interval of the overflow probability
+    :param day_precision: Largest half-width of the interval of the mean overflow day, not checked when None or when no simulation overflows
+    :param vacant_beds_precision: Largest half-width of the interval of the mean percentage of vacant beds, not checked when None
+    :param z: z-score of the intervals, 1.96 for 95% confidence
+    :param batch_size: Number of simulations between two checks of the precision
+    :param max_simulation: Largest number of simulations to run
+    :param max_seconds: Longest time to run for, no limit when None
+    :param do_threading: Run the batches on a SimulationExecutor process pool
+    :param seed: Master seed of the run, a fresh one when None
+    :param processes: Number of worker processes with do_threading, all the available cores when None
+    :param sample_size: Number of trajectories kept in a random sample for plotting
+    :param executor: Running SimulationExecutor to use with do_threading, left open so that it serves the next run;
+                     a new one which is closed at the end when None
+    :return: summary: Statistics of the run, summary.count is the number of simulations used; the number and the final
+             intervals, with their half-width against the requested precision, are printed
+    >>> summary = adaptive_simulation(60, 2710000, 33000, probability_precision=0.05, batch_size=50, seed=1)
+    Simulations used: 50
+    overflow_probability: [0.92865, 1], half-width 0.035675 (target 0.05)
+    overflow_day: [41.5621, 42.6379], half-width 0.537862
+    vacant_beds: [0, 0], half-width 0
+    >>> summary.count, summary.overflow_probability
+    (50, 1.0)
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    precisions = {'overflow_probability': probability_precision, 'overflow_day': day_precision, 'vacant_beds': vacant_beds_precision}
+    summary = SimulationSummary(number_of_days, total_beds, sample_size=sample_size, seed=seed)
+    owned = do_threading and executor is None
+    executor = (executor or SimulationExecutor(processes)) if do_threading else None
+    start_time = time.time()
+    try:
+        while summary.count < max_simulation:
+            size = min(batch_size, max_simulation - summary.count)
+            if executor is not None:
+                for start, bed_count in executor.imap(number_of_days, size, population, total_beds, seed, first_simulation_id=summary.count):
+                    summary.update(bed_count)
+            else:
+                bed_count, days = model_batch(size, number_of_days, population, total_beds, range(summary.count, summary.count + size), seed)
+                summary.update(bed_count)
+
+            intervals = summary.intervals(z)
+            met = {name: precision is None or (intervals[name][1] - intervals[name][0]) / 2 <= precision for name, precision in precisions.items()}
+            # The mean overflow day does not exist when the beds never overflow
+            if summary.overflow_days.sum() == 0:
+                met['overflow_day'] = met['overflow_probability']
+            if all(met.values()):
+                break
+            if max_seconds is not None and time.time() - start_time >= max_seconds:
+                break
+    finally:
+        if owned:
+            executor.close()
+
+    print('Simulations used:', summary.count)
+    for name, (low, high) in summary.intervals(z).items():
+        target = '' if precisions[name] is None else ' (target %g)' % precisions[name]
+        print('%s: [%g, %g], half-width %g%s' % (name, low, high, (high - low) / 2, target))
+    return summary
+
+
+def variance_reduction(number_of_days: int, population: int, total_beds: int, number_of_simulation: int, repetitions: int = 20, strategies=SAMPLING_STRATEGIES, seed: int = None) -> dict:
+    """
+    Measures how much each sampling strategy reduces the variance of the estimates against plain sampling
+    Every strategy runs the same number of independent repetitions of number_of_simulation simulations, the variance of
+    each estimate across the repetitions is then compared with the variance under plain sampling. The simulations are
+    stratified in blocks of STRATIFICATION_BLOCK as in every other run, so number_of_simulation must be a multiple of it
+    for each repetition to cover whole blocks of its own
+    :param number_of_days: Number of days for which the simulation has to run
+    :param population: Population in the region considered
+    :param total_beds: Total hospital beds available in the region considered
+    :param number_of_simulation: Number of simulations of each repetition
+    :param repetitions: Number of independent repetitions of every strategy
+    :param strategies: Sampling strategies to compare, from SAMPLING_STRATEGIES
+    :param seed: Master seed, a fresh one when None
+    :return: reduction: Variance of plain sampling divided by the variance of the strategy, for each strategy and estimate
+             (overflow probability, mean overflow day and mean available beds on the last day), nan when both are zero
+    >>> reduction = variance_reduction(30, 2710000, 33000, 256, repetitions=4, strategies=('plain', 'antithetic'), seed=1)
+    >>> sorted(reduction), sorted(reduction['plain'])
+    (['antithetic', 'plain'], ['beds_last_day', 'overflow_day', 'overflow_probability'])
+    >>> reduction['plain']['beds_last_day']
+    1.0
+    >>> variance_reduction(30, 2710000, 33000, 100, strategies=('antithetic',))
+    Traceback (most recent call last):
+    ...
+    ValueError: number_of_simulation must be a multiple of 256, not 100.
+    """
+    if number_of_simulation % STRATIFICATION_BLOCK:
+        raise ValueError('number_of_simulation must be a multiple of %d, not %d.' % (STRATIFICATION_BLOCK, number_of_simulation))
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    estimates = {}
+    for strategy in dict.fromkeys(('plain',) + tuple(strategies)):
+        rows = []
+        for repetition in range(repetitions):
+            ids = range(repetition * number_of_simulation, (repetition + 1) * number_of_simulation)
+            bed_count, days = model_batch(number_of_simulation, number_of_days, population, total_beds, ids, seed, strategy)
+            overflow_day, perc_vacant_beds = beds_outcome(bed_count, total_beds)
+            rows.append((len(overflow_day) / number_of_simulation, overflow_day.mean() if len(overflow_day) else np.nan, bed_count[:, -1].mean()))
+        with warnings.catch_warnings():
+            # The mean overflow day has no variance when the beds overflow in fewer than two repetitions
+            warnings.simplefilter('ignore', RuntimeWarning)
+            estimates[strategy] = np.nanvar(np.array(rows), axis=0, ddof=1)
+
+    names = ('overflow_probability', 'overflow_day', 'beds_last_day')
+    reduction = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for strategy in strategies:
+            ratio = estimates['plain'] / estimates[strategy]
+            reduction[strategy] = {name: float(value) for name, value in zip(names, ratio)}
+    return reduction
+
+
+def scenario_sweep(populations, total_beds, numbers_of_days, number_of_simulation: int, seed: int = None, chunk_size: int = 4096, keep_trajectories: bool = False) -> dict:
+    """
+    Evaluates every cell of a grid of populations, bed counts and horizons in one pass with common random numbers
+    The draws of the class Variables are made once per simulation for the longest horizon and shared by all the cells,
+    the compartments and bed ledger are computed once per population and shared by all the bed counts,
+    and a shorter horizon is the first days of the longest one
+    :param populations: Populations of the regions considered
+    :param total_beds: Total hospital beds to consider
+    :param numbers_of_days: Numbers of days for which the simulation has to run
+    :param number_of_simulation: Total number of simulations for every cell
+    :param seed: Master seed of the sweep, a fresh one when None
+    :param chunk_size: Number of simulations computed together
+    :param keep_trajectories: Keep every trajectory in the summary of each cell as well
+    :return: summaries: SimulationSummary of each (population, total_beds, number_of_days) cell
+    >>> summaries = scenario_sweep([2710000], [33000, 66000], [30, 60], 20, seed=1, keep_trajectories=True)
+    >>> sorted(summaries)
+    [(2710000, 33000, 30), (2710000, 33000, 60), (2710000, 66000, 30), (2710000, 66000, 60)]
+    >>> summaries[(2710000, 66000, 60)].overflow_probability <= summaries[(2710000, 33000, 60)].overflow_probability
+    True
+    >>> bool((summaries[(2710000, 33000, 30)].trajectories == model_batch(20, 30, 2710000, 33000, seed=1)[0]).all())
+    True
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    populations, total_beds, numbers_of_days = list(populations), list(total_beds), list(numbers_of_days)
+    longest = max(numbers_of_days)
+    summaries = {(population, beds, days): SimulationSummary(days, beds, keep_trajectories=keep_trajectories)
+                 for population in populations for beds in total_beds for days in numbers_of_days}
+
+    with progress_bar(number_of_simulation) as bar:
+        for start in range(0, number_of_simulation, chunk_size):
+            stop = min(start + chunk_size, number_of_simulation)
+            draws = Variables.draw_batch(stop - start, longest, range(start, stop), seed)
+            for population in populations:
+                occupancy = model_ledger(draws, population, 0).occupancy
+                for beds in total_beds:
+                    bed_count = beds - occupancy
+                    for days in numbers_of_days:
+                        summaries[(population, beds, days)].update(bed_count[:, :days])
+            bar.update(stop - start)
+    return summaries
+
+
+# Largest number of cells (rows x days) of the arrays of one block of region_block(), 2**21 keeps the draws near 130 MB
+REGION_BLOCK_CELLS = 2 ** 21
+
+
+def region_block(number_of_days: int, start: int, stop: int, populations, total_beds, seed: int) -> tuple:
+    """
+        Runs the simulations start to stop - 1 of every region
+        The regions are laid out as columns of shared arrays: each row of the draws, compartments and bed ledger is one
+        (region, simulation) pair and model_ledger() advances all of them together each day. The simulations are taken a few
+        at a time so that the arrays stay within REGION_BLOCK_CELLS, one simulation of every region at least
+        :param number_of_days: Number of days for which the simulation has to run
+        :param start: ID of the first simulation
+        :param stop: ID after the last simulation
+        :param populations: Population of each region
+        :param total_beds: Total hospital beds of each region
+        :param seed: Master seed, each simulation draws all its regions from its own random stream, see Variables.draw_regions()
+        :return: start: ID of the first simulation,
+                    overflow_days: number of simulations which overflow first on each day, shape (regions, number_of_days),
+                    beds_sum: sum of the available beds over the simulations, shape (regions, number_of_days),
+                    system_beds: available beds of all the regions together, shape (stop - start, number_of_days),
+                    any_overflow: whether at least one region overflows in each simulation, shape (stop - start,)
+        >>> start, overflow_days, beds_sum, system_beds, any_overflow = region_block(3, 0, 2, [200, 300], [100, 50], seed=1)
+        >>> overflow_days.tolist(), beds_sum.tolist(), system_beds.tolist(), any_overflow.tolist()
+        ([[0, 0, 0], [0, 0, 0]], [[200.0, 200.0, 200.0], [100.0, 100.0, 100.0]], [[150.0, 150.0, 150.0], [150.0, 150.0, 150.0]], [False, False])
+        """
+    populations = np.asarray(populations, dtype=float)
+    total_beds = np.asarray(total_beds, dtype=float)
+    regions = len(populations)
+    number_of_simulation = stop - start
+    overflow_days = np.zeros((regions, number_of_days), dtype=np.int64)
+    beds_sum = np.zeros((regions, number_of_days))
+    system_beds = np.zeros((number_of_simulation, number_of_days))
+    any_overflow = np.zeros(number_of_simulation, dtype=bool)
+    simulations_per_block = max(1, REGION_BLOCK_CELLS // (regions * number_of_days))
+    for first in range(start, stop, simulations_per_block):
+        last = min(first + simulations_per_block, stop)
+        block = slice(first - start, last - start)
+        draws = Variables.draw_regions(range(first, last), number_of_days, regions, seed)
+        # Region-major rows: the simulations of the first region, then those of the next one
+        row_regions = np.repeat(np.arange(regions), last - first)
+        ledger = model_ledger(draws, populations[row_regions], total_beds[row_regions])
+        available = ledger.available.reshape(regions, last - first, number_of_days)
+        with PROFILER.stage('postprocess'):
+            overflowing = available < 0
+            has_overflow = overflowing.any(axis=2)
+            slots = (np.arange(regions)[:, None] * number_of_days + overflowing.argmax(axis=2))[has_overflow]
+            overflow_days += np.bincount(slots, minlength=regions * number_of_days).reshape(regions, number_of_days)
+            beds_sum += available.sum(axis=1)
+            system_beds[block] = available.sum(axis=0)
+            any_overflow[block] = has_overflow.any(axis=0)
+    return start, overflow_days, beds_sum, system_beds, any_overflow
+
+
+def _run_region_chunk(task: tuple) -> tuple:
+    """
+    Runs region_block() in a worker process
+    :param task: Arguments of region_block()
+    :return: Result of region_block()
+    """
+    return region_block(*task)
+
+
+class RegionSummary:
+    """
+        Statistics of a multi-region run which are updated as each block of region_block() finishes
+        Per region: the overflow-day histogram and the per-day mean of available beds. For the whole system: a SimulationSummary
+        of the beds of all the regions together, as if patients could be moved to any region, and the number of
+        simulations in which at least one region overflows
+        >>> summary = RegionSummary([200, 300], [100, 50], 3)
+        >>> summary.update(region_block(3, 0, 2, [200, 300], [100, 50], seed=1))
+        >>> summary.count, summary.overflow_probability.tolist(), summary.any_overflow_probability, summary.system.total_beds
+        (2, [0.0, 0.0], 0.0, 150.0)
+        """
+    def __init__(self, populations, total_beds, number_of_days: int, sample_size: int = 0, seed: int = None):
+        """
+        :param populations: Population of each region
+        :param total_beds: Total hospital beds of each region
+        :param number_of_days: Number of days for which the simulation has to run
+        :param sample_size: Number of system-wide trajectories kept in a random sample for plotting
+        :param seed: Seed of the random sample
+        """
+        self.populations = np.asarray(populations)
+        self.total_beds = np.asarray(total_beds, dtype=float)
+        self.number_of_days = number_of_days
+        self.count = 0
+        self.overflow_days = np.zeros((len(self.populations), number_of_days), dtype=np.int64)
+        self._beds_sum = np.zeros((len(self.populations), number_of_days))
+        self._any_overflow = 0
+        self.system = SimulationSummary(number_of_days, float(self.total_beds.sum()), sample_size=sample_size, seed=seed)
+
+    def update(self, block: tuple):
+        """
+        Adds a block of simulations of every region
+        :param block: Result of region_block()
+        """
+        start, overflow_days, beds_sum, system_beds, any_overflow = block
+        with PROFILER.stage('aggregate'):
+            self.count += len(system_beds)
+            self.overflow_days += overflow_days
+            self._beds_sum += beds_sum
+            self._any_overflow += int(any_overflow.sum())
+        self.system.update(system_beds)
+
+    @property
+    def overflow_probability(self) -> np.ndarray:
+        """Share of the simulations in which each region runs out of beds"""
+        return self.overflow_days.sum(axis=1) / max(self.count, 1)
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Per-day mean of the available beds of each region, shape (regions, number_of_days)"""
+        return self._beds_sum / max(self.count, 1)
+
+    @property
+    def any_overflow_probability(self) -> float:
+        """Share of the simulations in which at least one region runs out of beds"""
+        return self._any_overflow / self.count if self.count else 0.0
+
+
+def multi_region_simulation(number_of_days: int, number_of_simulation: int, populations, total_beds, do_threading=True, seed: int = None, processes: int = None,
+                            chunk_size: int = None, sample_size: int = 0, executor: SimulationExecutor = None, progress: bool = True) -> RegionSummary:
+    """
+    Simulates many regions or hospital service areas in one run
+    Each block of simulations covers every region, see region_block(), so memory depends on the chunk size and not on
+    the number of simulations or regions
+    :param number_of_days: Number of days for which the simulation has to run
+    :param number_of_simulation: Total number of simulations of every region
+    :param populations: Population of each region
+    :param total_beds: Total hospital beds of each region
+    :param do_threading: Run the blocks of simulations on a SimulationExecutor process pool
+    :param seed: Master seed of the run, a fresh one when None
+    :param processes: Number of worker processes with do_threading, all the available cores when None
+    :param chunk_size: Number of simulations per block, chosen from the number of workers with do_threading and 4096 at most when None
+    :param sample_size: Number of system-wide trajectories kept in a random sample for plotting
+    :param executor: Running SimulationExecutor to use with do_threading, left open; a new one which is closed at the end when None
+    :param progress: Show a progress bar
+    :return: summary: Statistics of each region and of the whole system
+    >>> summary = multi_region_simulation(60, 40, [2710000, 2710000, 203250], [33000, 66000, 33000], do_threading=False, seed=1, progress=False)
+    >>> summary.overflow_probability.tolist(), summary.any_overflow_probability
+    ([1.0, 0.0, 0.0], 1.0)
+    >>> in_blocks = multi_region_simulation(60, 40, [2710000, 2710000, 203250], [33000, 66000, 33000], do_threading=False, seed=1, chunk_size=7, progress=False)
+    >>> bool(np.allclose(in_blocks.mean, summary.mean)), bool((in_blocks.system.overflow_days == summary.system.overflow_days).all())
+    (True, True)
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    populations, total_beds = list(populations), list(total_beds)
+    if len(populations) != len(total_beds):
+        raise ValueError('%d populations for %d bed counts.' % (len(populations), len(total_beds)))
+    summary = RegionSummary(populations, total_beds, number_of_days, sample_size=sample_size, seed=seed)
+    with progress_bar(number_of_simulation, progress) as bar:
+        if do_threading:
+            owned = executor is None
+            executor = executor or SimulationExecutor(processes)
+            chunk_size = chunk_size or executor.chunk_size(number_of_simulation)
+            tasks = [(number_of_days, start, min(start + chunk_size, number_of_simulation), populations, total_beds, seed)
+                     for start in range(0, number_of_simulation, chunk_size)]
+            try:
+                for block in executor.map(_run_region_chunk, tasks):
+                    summary.update(block)
+                    bar.update(len(block[3]))
+            finally:
+                if owned:
+                    executor.close()
+        else:
+            chunk_size = chunk_size or 4096
+            for start in range(0, number_of_simulation, chunk_size):
+                stop = min(start + chunk_size, number_of_simulation)
+                summary.update(region_block(number_of_days, start, stop, populations, total_beds, seed))
+                bar.update(stop - start)
+    return summary
+
+
+def _run_store_chunk(task: tuple) -> int:
+    """
+        Worker task of run_store(), runs one chunk of a TrajectoryStore and writes it into the mapped files
+        :param task: directory of the store, first and last + 1 simulation ID
+        :return: First simulation ID of the chunk
+        """
+    path, start, stop = task
+    store = TrajectoryStore(path)
+    inputs = store.metadata
+    draws = Variables.draw_batch(stop - start, inputs['number_of_days'], range(start, stop), inputs['seed'], inputs['strategy'])
+    ledger = model_ledger(draws, inputs['population'], inputs['total_beds'])
+    beds = store.open('beds', 'r+')
+    beds[start:stop] = ledger.available
+    beds.flush()
+    parameters = store.open('parameters', 'r+')
+    parameters[start:stop] = draws.mean(axis=2).T
+    parameters.flush()
+    del beds, parameters
+    return start
+
+
+class TrajectoryStore:
+    """
+        On-disk result of a run, in a directory with
+        beds.npy: memory-mapped array of available beds of shape (number_of_simulation, number_of_days)
+        parameters.npy: mean of each daily variable of Variables.batch_samplers() for each simulation, shape (number_of_simulation, 8);
+                        the daily draws themselves can be made again with Variables.draw_batch() from the seed
+        metadata.json: inputs and seed of the run and the chunks already written
+        The arrays are written chunk by chunk, so an interrupted run continues from the chunks it has not written yet
+        >>> import tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> store = TrajectoryStore.create(directory, 4, 5, 2710000, 33000, seed=1, chunk_size=2)
+        >>> store.pending_chunks()
+        [0, 2, 4]
+        >>> store.mark_done([0, 4])
+        >>> TrajectoryStore(directory).pending_chunks()
+        [2]
+        """
+    def __init__(self, path: str):
+        """
+        :param path: Directory of an existing store
+        """
+        self.path = path
+        with open(os.path.join(path, 'metadata.json')) as metadata:
+            self.metadata = json.load(metadata)
+
+    @classmethod
+    def create(cls, path: str, number_of_days: int, number_of_simulation: int, population: int, total_beds: int, seed: int, chunk_size: int = 4096, strategy: str = 'plain'):
+        """
+        Creates the files of an empty store
+        :param path: Directory of the store, created when missing
+        :param number_of_days: Number of days for which the simulation has to run
+        :param number_of_simulation: Total number of simulations
+        :param population: Population in the region considered
+        :param total_beds: Total hospital beds available in the region considered
+        :param seed: Master seed of the run
+        :param chunk_size: Number of simulations written together
+        :param strategy: Sampling strategy within each chunk, one of SAMPLING_STRATEGIES
+        :return: store: The new store
+        """
+        os.makedirs(path, exist_ok=True)
+        np.lib.format.open_memmap(os.path.join(path, 'beds.npy'), mode='w+', shape=(number_of_simulation, number_of_days))
+        np.lib.format.open_memmap(os.path.join(path, 'parameters.npy'), mode='w+', shape=(number_of_simulation, len(Variables.batch_samplers())))
+        metadata = {'number_of_days': number_of_days, 'number_of_simulation': number_of_simulation, 'population': population,
+                    'total_beds': total_beds, 'seed': seed, 'chunk_size': chunk_size, 'strategy': strategy, 'completed': []}
+        cls._write_metadata(path, metadata)
+        return cls(path)
+
+    @staticmethod
+    def _write_metadata(path: str, metadata: dict):
+        """
+        Replaces metadata.json in one step, so that a crash never leaves it half written
+        """
+        temporary = os.path.join(path, 'metadata.json.tmp')
+        with open(temporary, 'w') as file:
+            json.dump(metadata, file, indent=2)
+        os.replace(temporary, os.path.join(path, 'metadata.json'))
+
+    def open(self, name: str, mode: str = 'r') -> np.memmap:
+        """
+        :param name: beds or parameters
+        :param mode: r to read, r+ to write
+        :return: Memory-mapped array of the store
+        """
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode=mode)
+
+    @property
+    def beds(self) -> np.memmap:
+        """Read-only memory-mapped array of available beds"""
+        return self.open('beds')
+
+    @property
+    def parameters(self) -> np.memmap:
+        """Read-only memory-mapped array of the mean sampled parameters of each simulation"""
+        return self.open('parameters')
+
+    def chunks(self) -> list:
+        """
+        :return: First simulation ID of every chunk
+        """
+        return list(range(0, self.metadata['number_of_simulation'], self.metadata['chunk_size']))
+
+    def pending_chunks(self) -> list:
+        """
+        :return: First simulation ID of every chunk not written yet
+        """
+        completed = set(self.metadata['completed'])
+        return [start for start in self.chunks() if start not in completed]
+
+    def mark_done(self, starts):
+        """
+        Records chunks as written, once their arrays have been flushed
+        :param starts: First simulation ID of each chunk
+        """
+        self.metadata['completed'] = sorted(set(self.metadata['completed']) | set(starts))
+        self._write_metadata(self.path, self.metadata)
+
+    def blocks(self, chunk_size: int = None):
+        """
+        Reads the available beds one block of rows at a time
+        :param chunk_size: Number of simulations per block, the chunk size of the store when None
+        :return: Generator of arrays of available beds
+        """
+        beds = self.beds
+        chunk_size = chunk_size or self.metadata['chunk_size']
+        for start in range(0, len(beds), chunk_size):
+            yield np.asarray(beds[start:start + chunk_size])
+
+
+def run_store(path: str, number_of_days: int, number_of_simulation: int, population: int, total_beds: int, seed: int = None, do_threading=True, processes: int = None, chunk_size: int = None, strategy: str = None) -> TrajectoryStore:
+    """
+    Runs the simulations into a TrajectoryStore, or continues the run already in the directory
+    :param path: Directory of the store
+    :param number_of_days: Number of days for which the simulation has to run
+    :param number_of_simulation: Total number of simulations
+    :param population: Population in the region considered
+    :param total_beds: Total hospital beds available in the region considered
+    :param seed: Master seed of the run, a fresh one when None, the one of the store when continuing
+    :param do_threading: Run the chunks on a SimulationExecutor process pool
+    :param processes: Number of worker processes with do_threading, all the available cores when None
+    :param chunk_size: Number of simulations written together, 4096 when None, the one of the store when continuing
+    :param strategy: Sampling strategy, one of SAMPLING_STRATEGIES, plain when None, the one of the store when continuing
+    :return: store: The complete store
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> store = TrajectoryStore.create(directory, 30, 5, 2710000, 33000, seed=1, chunk_size=2)
+    >>> _ = _run_store_chunk((directory, 0, 2))
+    >>> store.mark_done([0])
+    >>> store = run_store(directory, 30, 5, 2710000, 33000, do_threading=False)
+    >>> bool((store.beds[:] == model_batch(5, 30, 2710000, 33000, seed=1)[0]).all()), store.pending_chunks()
+    (True, [])
+    >>> run_store(directory, 30, 5, 2710000, 33000, strategy='sobol')  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: strategy of the run in ... is plain, not sobol.
+    """
+    inputs = {'number_of_days': number_of_days, 'number_of_simulation': number_of_simulation, 'population': population, 'total_beds': total_beds}
+    # Inputs which take the value of the store when they are not given
+    optional = {'seed': seed, 'chunk_size': chunk_size, 'strategy': strategy}
+    if os.path.exists(os.path.join(path, 'metadata.json')):
+        store = TrajectoryStore(path)
+        inputs.update((name, value) for name, value in optional.items() if value is not None)
+        for name, value in inputs.items():
+            if store.metadata[name] != value:
+                raise ValueError('%s of the run in %s is %s, not %s.' % (name, path, store.metadata[name], value))
+    else:
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        store = TrajectoryStore.create(path, number_of_days, number_of_simulation, population, total_beds, seed, chunk_size or 4096, strategy or 'plain')
+
+    chunk_size = store.metadata['chunk_size']
+    tasks = [(path, start, min(start + chunk_size, number_of_simulation)) for start in store.pending_chunks()]
+    with progress_bar(number_of_simulation, initial=number_of_simulation - sum(stop - start for _, start, stop in tasks)) as bar:
+        if do_threading:
+            with SimulationExecutor(processes) as executor:
+                for start in executor.map(_run_store_chunk, tasks):
+                    store.mark_done([start])
+                    bar.update(min(chunk_size, number_of_simulation - start))
+        else:
+            for task in tasks:
+                store.mark_done([_run_store_chunk(task)])
+                bar.update(task[2] - task[1])
+    return store
+
+
+def plot_summary(summary: SimulationSummary, directory: str = '.', percentiles=(5, 50, 95)):
+    """
+    Draws the percent-vacant-beds and overflow-day histograms and the beds-vs-days plot from the aggregated arrays of a
+    SimulationSummary, so the time taken does not depend on the number of simulations
+    The beds-vs-days plot is a heatmap of the share of simulations with each number of available beds on each day,
+    with the percentile fan chart and the random sample of trajectories of the summary drawn over it
+    :param summary: Statistics of a run
+    :param directory: Directory of the figures
+    :param percentiles: Percentiles of the fan chart, the band covers the lowest to the highest
+    >>> plot_summary(SimulationSummary(3, 10))
+    Traceback (most recent call last):
+    ...
+    ValueError: the summary has no simulations to plot.
+    """
+    if not summary.count:
+        raise ValueError('the summary has no simulations to plot.')
+    import matplotlib.pyplot as plt
+    days = np.arange(summary.number_of_days)
+
+    # Plot for Hypothesis - 2
+    plt.hist(summary.vacant_beds_edges[:-1], bins=summary.vacant_beds_edges, weights=summary.vacant_beds_histogram)
+    plt.ylabel('Frequency')
+    plt.xlabel('% vacant beds')
+    plt.title("Percent Vacant Beds")
+    plt.savefig(os.path.join(directory, 'percent_vacant_beds-hist.png'))
+    plt.clf()
+
+    # Plot for Hypothesis - 1
+    plt.hist(days, bins=np.arange(summary.number_of_days + 1), weights=summary.overflow_days)
+    plt.ylabel('Frequency')
+    plt.xlabel('Number of Days until Overflow')
+    plt.title("nth Day When Beds Overflows")
+    plt.savefig(os.path.join(directory, 'overflow-days-hist.png'))
+    plt.clf()
+
+    # Plot for simulation, only the bins that were reached are shown
+    reached = np.flatnonzero(summary.bed_histogram.sum(axis=0))
+    edges = summary.bed_edges
+    density = summary.bed_histogram[:, reached[0]:reached[-1] + 1].T / summary.count
+    # The colour scale is capped so that the first days, when every simulation has all the beds, do not wash out the rest
+    plt.imshow(density, aspect='auto', origin='lower', cmap='Blues', interpolation='nearest', vmax=np.percentile(density[density > 0], 99),
+               extent=(-0.5, summary.number_of_days - 0.5, edges[reached[0]], edges[reached[-1] + 1]))
+    plt.colorbar(label='Share of simulations')
+    if len(summary.sample):
+        plt.plot(days, summary.sample.T, color='grey', linewidth=0.5, alpha=0.6)
+    lines = {q: summary.percentile(q) for q in sorted(percentiles)}
+    plt.fill_between(days, lines[min(lines)], lines[max(lines)], color='orange', alpha=0.3,
+                     label='%g-%g percentile' % (min(lines), max(lines)))
+    for q, line in lines.items():
+        plt.plot(days, line, color='darkorange', linewidth=2 if q == 50 else 1)
+    plt.legend()
+    plt.ylabel('Available Beds')
+    plt.xlabel('Number of Days')
+    plt.title("Available Number of Beds")
+    plt.tight_layout()
+    plt.savefig(os.path.join(directory, 'beds-vs-days.png'))
+    plt.clf()
+
+
+def plot_store(store: TrajectoryStore, directory: str = '.', sample_size: int = 50, partial: bool = False):
+    """
+    Draws the figures of plot_summary() for a TrajectoryStore, reading the mapped trajectories one chunk at a time
+    :param store: Store of a run
+    :param directory: Directory of the figures
+    :param sample_size: Number of trajectories drawn over the heatmap
+    :param partial: Draw the chunks already written of an unfinished run, instead of raising an error
+    >>> import tempfile
+    >>> plot_store(TrajectoryStore.create(tempfile.mkdtemp(), 30, 5, 2710000, 33000, seed=1, chunk_size=2))
+    Traceback (most recent call last):
+    ...
+    ValueError: 3 of the 3 chunks of the run are not written yet, run_store() completes it.
+    """
+    pending = store.pending_chunks()
+    if pending and not partial:
+        raise ValueError('%d of the %d chunks of the run are not written yet, run_store() completes it.' % (len(pending), len(store.chunks())))
+    summary = SimulationSummary(store.metadata['number_of_days'], store.metadata['total_beds'], sample_size=sample_size, seed=store.metadata['seed'])
+    chunk_size = store.metadata['chunk_size']
+    beds = store.beds
+    for start in store.chunks():
+        if start not in pending:
+            summary.update(np.asarray(beds[start:start + chunk_size]))
+    plot_summary(summary, directory)
+
+
+SCENARIO_FIELDS = ('population', 'total_beds', 'number_of_days', 'number_of_simulation', 'seed')
+
+
+def load_scenarios(path: str) -> list:
+    """
+    Reads a file of scenarios, either CSV with a header row or JSON with a list of objects
+    Each scenario has a population, total_beds, number_of_days and number_of_simulation, and optionally a seed
+    (a fresh one when missing) and a name (the row number when missing). The names are the directories of the results,
+    so they must be different from each other and cannot contain a path separator
+    :param path: File of the scenarios, JSON when it ends with .json
+    :return: scenarios: List of dictionaries with a name and the fields of SCENARIO_FIELDS
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'scenarios.csv')
+    >>> with open(path, 'w') as file:
+    ...     _ = file.write('name,population,total_beds,number_of_days,number_of_simulation,seed\\nbefore,2710000,33000,60,1000,1\\n')
+    ...     _ = file.write(',2710000,66000,60,1000,\\n')
+    >>> [(scenario['name'], scenario['total_beds'], scenario['seed'] is None) for scenario in load_scenarios(path)]
+    [('before', 33000, False), ('scenario-2', 66000, True)]
+    >>> with open(path, 'a') as file:
+    ...     _ = file.write('before,203250,33000,60,1000,1\\n')
+    >>> load_scenarios(path)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: scenario 3 of ... has the name before of another scenario.
+    """
+    with open(path, newline='') as file:
+        rows = json.load(file) if path.endswith('.json') else list(csv.DictReader(file))
+    scenarios = []
+    for number, row in enumerate(rows, 1):
+        missing = [field for field in SCENARIO_FIELDS[:-1] if row.get(field) in (None, '')]
+        if missing:
+            raise ValueError('scenario %d of %s has no %s.' % (number, path, ', '.join(missing)))
+        scenario = {'name': str(row.get('name') or 'scenario-%d' % number)}
+        if scenario['name'] in ('.', '..') or any(separator and separator in scenario['name'] for separator in (os.sep, os.altsep, '/')):
+            raise ValueError('scenario %d of %s has the name %s, which is not a directory name.' % (number, path, scenario['name']))
+        if scenario['name'] in (other['name'] for other in scenarios):
+            raise ValueError('scenario %d of %s has the name %s of another scenario.' % (number, path, scenario['name']))
+        for field in SCENARIO_FIELDS:
+            scenario[field] = int(row[field]) if row.get(field) not in (None, '') else None
+        scenarios.append(scenario)
+    return scenarios
+
+
+def _finite(value):
+    """Float of a value, None when it is not finite, for the JSON results"""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def summary_record(summary: SimulationSummary, days: bool = False) -> dict:
+    """
+    Statistics of a SimulationSummary as a dictionary which can be written as JSON
+    :param summary: Statistics of a run
+    :param days: Add the per-day mean and 5th, 50th and 95th percentiles of the available beds
+    :return: record: Number of simulations, overflow probability, mean overflow day and vacant beds with their 95% intervals
+    >>> summary = SimulationSummary(2, 10)
+    >>> summary.update(np.array([[5, -1], [4, 3], [6, -2], [4, 5]]))
+    >>> record = summary_record(summary)
+    >>> record['number_of_simulation'], record['overflow_probability'], record['intervals']['overflow_day']
+    (4, 0.5, [1.0, 1.0])
+    """
+    record = {'number_of_simulation': summary.count, 'overflow_probability': _finite(summary.overflow_probability),
+              'overflow_day_mean': _finite(summary.overflow_day_mean), 'vacant_beds_mean': _finite(summary.vacant_beds_mean),
+              'intervals': {name: [_finite(low), _finite(high)] for name, (low, high) in summary.intervals().items()}}
+    if days:
+        record.update(mean=summary.mean.tolist(), percentiles={str(q): summary.percentile(q).tolist() for q in (5, 50, 95)})
+    return record
+
+
+def run_batch(scenarios: list, directory: str = 'results', plots: bool = False, do_threading=True, processes: int = None, chunk_size: int = None,
+              strategy: str = 'plain', sample_size: int = 50, progress: bool = False, precision: float = None, max_seconds: float = None) -> list:
+    """
+    Runs many scenarios without any prompt, on one SimulationExecutor pool which stays alive between them
+    With a precision, each scenario runs adaptive_simulation() until the overflow probability is that precise, its
+    number_of_simulation is then the largest number of simulations to run
+    Each scenario gets a directory with summary.json, its inputs, seed, statistics and per-day percentiles of the available beds,
+    and the figures of plot_summary() when plots is set; results.json in the directory lists the results of all of them
+    :param scenarios: Scenarios of load_scenarios()
+    :param directory: Directory of the results
+    :param plots: Draw the figures of each scenario, matplotlib is only imported then
+    :param do_threading: Run the simulations on a SimulationExecutor process pool
+    :param processes: Number of worker processes with do_threading, all the available cores when None
+    :param chunk_size: Number of simulations per block, 4096 at most when None
+    :param strategy: Sampling strategy within each block, one of SAMPLING_STRATEGIES
+    :param sample_size: Number of trajectories drawn over the heatmap of the figures
+    :param progress: Show a progress bar for each scenario
+    :param precision: Largest half-width of the interval of the overflow probability of adaptive runs, fixed runs when None
+    :param max_seconds: Longest time to run each adaptive scenario for, no limit when None
+    :return: results: Result of each scenario, as written to its summary.json without the per-day arrays
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> scenarios = [{'name': 'before', 'population': 2710000, 'total_beds': 33000, 'number_of_days': 60, 'number_of_simulation': 50, 'seed': 1},
+    ...              {'name': 'after', 'population': 2710000, 'total_beds': 66000, 'number_of_days': 60, 'number_of_simulation': 50, 'seed': 1}]
+    >>> results = run_batch(scenarios, directory, do_threading=False)
+    >>> [result['name'] for result in results], results[1]['overflow_probability'] <= results[0]['overflow_probability']
+    (['before', 'after'], True)
+    >>> sorted(os.listdir(directory)), sorted(os.listdir(os.path.join(directory, 'before')))
+    (['after', 'before', 'results.json'], ['summary.json'])
+    >>> results = run_batch(scenarios[:1], directory, do_threading=False, precision=0.05)  # doctest: +ELLIPSIS
+    Simulations used: 50
+    ...
+    >>> results[0]['number_of_simulation']
+    50
+    """
+    if precision is not None and strategy != 'plain':
+        raise ValueError('adaptive runs use the plain strategy, not %s.' % strategy)
+    os.makedirs(directory, exist_ok=True)
+    executor = SimulationExecutor(processes) if do_threading else None
+    results = []
+    try:
+        for scenario in scenarios:
+            seed = scenario.get('seed')
+            if seed is None:
+                seed = np.random.SeedSequence().entropy
+            start = time.time()
+            if precision is None:
+                summary = simulation_summary(scenario['number_of_days'], scenario['number_of_simulation'], scenario['population'], scenario['total_beds'],
+                                             do_threading, seed, chunk_size=chunk_size, strategy=strategy, sample_size=sample_size if plots else 0,
+                                             executor=executor, progress=progress)
+            else:
+                summary = adaptive_simulation(scenario['number_of_days'], scenario['population'], scenario['total_beds'], precision,
+                                              max_simulation=scenario['number_of_simulation'], max_seconds=max_seconds, do_threading=do_threading, seed=seed,
+                                              sample_size=sample_size if plots else 0, executor=executor)
+            seconds = time.time() - start
+            result = {'name': scenario['name'], 'population': scenario['population'], 'total_beds': scenario['total_beds'],
+                      'number_of_days': scenario['number_of_days'], 'seed': seed, 'strategy': strategy}
+            result.update(summary_record(summary), seconds=seconds)
+            results.append(result)
+
+            scenario_directory = os.path.join(directory, scenario['name'])
+            os.makedirs(scenario_directory, exist_ok=True)
+            record = dict(result, **summary_record(summary, days=True))
+            with open(os.path.join(scenario_directory, 'summary.json'), 'w') as file:
+                json.dump(record, file, indent=2)
+            if plots:
+                plot_summary(summary, scenario_directory)
+    finally:
+        if executor is not None:
+            executor.close()
+    with open(os.path.join(directory, 'results.json'), 'w') as file:
+        json.dump(results, file, indent=2)
+    return results
+
+
+def batch_main(argv=None) -> int:
+    """
+    Command line entry point of run_batch()
+    :param argv: Command line arguments, sys.argv when None
+    :return: Exit status
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='Runs the hospital capacity simulation for every scenario of a CSV or JSON file')
+    parser.add_argument('scenarios', help='file of the scenarios, with population, total_beds, number_of_days, number_of_simulation and optional seed and name')
+    parser.add_argument('--output', default='results', help='directory of the results')
+    parser.add_argument('--plots', action='store_true', help='draw the figures of each scenario')
+    parser.add_argument('--processes', type=int, help='number of worker processes, all the available cores by default')
+    parser.add_argument('--chunk-size', type=int, help='number of simulations per block')
+    parser.add_argument('--strategy', default='plain', choices=SAMPLING_STRATEGIES, help='sampling strategy within each block of %d simulation IDs, sobol needs scipy' % STRATIFICATION_BLOCK)
+    parser.add_argument('--progress', action='store_true', help='show a progress bar for each scenario')
+    parser.add_argument('--precision', type=float, help='run each scenario until the overflow probability is within this half-width, '
+                                                        'with number_of_simulation as the largest number of simulations')
+    parser.add_argument('--max-seconds', type=float, help='longest time of each scenario with --precision, no limit by default')
+    args = parser.parse_args(argv)
+    if args.precision is not None and args.strategy != 'plain':
+        parser.error('--precision runs use the plain strategy')
+
+    for result in run_batch(load_scenarios(args.scenarios), args.output, args.plots, processes=args.processes, chunk_size=args.chunk_size,
+                            strategy=args.strategy, progress=args.progress, precision=args.precision, max_seconds=args.max_seconds):
+        print('%-20s overflow probability %.4f  seed %s  %.2f s' % (result['name'], result['overflow_probability'], result['seed'], result['seconds']))
+    return 0
+
+
 if __name__ == '__main__':
+    # With arguments, the scenarios of a file are run without prompts, see batch_main()
+    if len(sys.argv) > 1:
+        sys.exit(batch_main())
 
     # Inputs for testing hypotheses
     # Hypothesis -1
@@ -351,36 +2428,22 @@ if __name__ == '__main__':
 
     population = int(input("Enter the total population to be considered: "))  # Chicago_population  = 2710000
     total_beds = int(input("Enter the number of beds to be considered: "))  # total_beds in Chicago      = 33000
-    simulations = int(input("Enter the number of simulations to be considered: "))  # Simulation= (Select any Number)
+    simulations = int(input("Enter the number of simulations to be considered, 0 to run until the result is precise enough: ") or 0)  # Simulation= (Select any Number)
     number_of_days = int(input("Enter the number of days to be considered: "))  # number_of_days   = 60
 
-    import time
-
-    start = time.time()
-    overflow_day, list_of_beds_and_days, perc_vacant_beds = simulation(number_of_days, simulations, population, total_beds, True)
+    if simulations:
+        start = time.time()
+        summary = simulation_summary(number_of_days, simulations, population, total_beds, True, sample_size=50)
+    else:
+        # Adaptive run: batches of simulations until the overflow probability is known to the precision, within the budgets
+        precision = float(input("Enter the largest half-width of the overflow probability interval [0.01]: ") or 0.01)
+        max_simulation = int(input("Enter the largest number of simulations [1000000]: ") or 1000000)
+        max_seconds = float(input("Enter the longest time in seconds [no limit]: ") or 0) or None
+        start = time.time()
+        summary = adaptive_simulation(number_of_days, population, total_beds, precision, max_simulation=max_simulation, max_seconds=max_seconds,
+                                      do_threading=True, sample_size=50)
+    print('The Probability of vacant beds is:', summary.overflow_probability, '%')
     print("Simulation time: %f" % (time.time() - start))
 
-    # Plot for Hypothesis - 2
-    # This plot is only used when the Hypothesis -2 is getting tested
-    plt.hist(perc_vacant_beds, bins=15)
-    plt.ylabel('Frequency')
-    plt.xlabel('% vacant beds')
-    plt.title("Percent Vacant Beds")
-    plt.savefig('percent_vacant_beds-hist.png')
-    plt.clf()
-
-    # Plot for Hypothesis - 1
-    plt.hist(overflow_day, bins=10)
-    plt.ylabel('Frequency')
-    plt.xlabel('Number of Days until Overflow')
-    plt.title("nth Day When Beds Overflows")
-    plt.savefig('overflow-days-hist.png')
-
-    # Plot for simulation
-    for beds, days in list_of_beds_and_days:
-        plt.plot(days, beds)
-    plt.ylabel('Available Beds')
-    plt.xlabel('Number of Days')
-    plt.title("Available Number of Beds")
-    plt.savefig('beds-vs-days.png')
-    plt.clf()
+    # Plots for Hypothesis - 1 and Hypothesis - 2 and for simulation
+    plot_summary(summary)
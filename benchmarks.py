@@ -0,0 +1,191 @@
+"""
+Benchmark suite of the Monte Carlo Simulation on Hospital Capacity During COVID-19
+
+Times the hot paths of PR_final_project separately: ran_pert_dist, each method of Variables, model(), the bed
+bookkeeping of test_result_days/admitted_bed/available_bed and simulation() from 60 days x 1,000 simulations to
+365 days x 100,000 simulations, with and without the process pool. The in-process runs go through model_batch() in
+blocks of simulation IDs, so the largest scale fits in memory as well.
+
+Usage:
+    python benchmarks.py                    run the suite, write benchmark_results.json and compare with the baseline
+    python benchmarks.py --quick            only the smallest scale of simulation()
+    python benchmarks.py --save-baseline    store the results as the baseline of this machine
+
+Each result is written to the output file as soon as its benchmark finishes, so an interrupted run keeps the finished ones.
+Exits with status 1 when a benchmark is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+import PR_final_project as project
+
+# (number_of_days, number_of_simulation) of the end-to-end runs
+SCALES = [(60, 1000), (365, 10000), (365, 100000)]
+POPULATION = 2710000  # Chicago area
+TOTAL_BEDS = 33000  # Chicago area
+
+
+def time_call(function, repeat: int = 5, number: int = 1) -> dict:
+    """
+    Times a function like timeit, without the output it prints
+    :param function: Function to call without arguments
+    :param repeat: Number of timings
+    :param number: Number of calls per timing
+    :return: Best and median time of one call in seconds, with repeat and number
+    >>> timing = time_call(lambda: sum(range(100)), repeat=3, number=10)
+    >>> sorted(timing), timing['best'] <= timing['median']
+    (['best', 'median', 'number', 'repeat'], True)
+    """
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            timings.append((time.perf_counter() - start) / number)
+    return {'best': min(timings), 'median': float(np.median(timings)), 'repeat': repeat, 'number': number}
+
+
+def benchmarks(quick: bool = False) -> dict:
+    """
+    :param quick: Only the smallest scale of simulation()
+    :return: Function, repeat and number of every benchmark, by name
+    >>> [name for name in benchmarks(quick=True) if name.startswith('simulation')]
+    ['simulation.pool[60x1000]', 'simulation.vectorized[60x1000]', 'simulation.reference[60x1000]']
+    """
+    days = 365
+    rng = np.random.default_rng(0)
+    lst_day = rng.integers(1, 7, days).tolist()
+    lst_time_to_outcome = rng.integers(8, 14, days).tolist()
+    lst_hospitalized = rng.integers(0, 2000, days).tolist()
+    lst_outcome = (np.array(lst_hospitalized) * 0.1).tolist()
+    new_days = (np.arange(days) + lst_day).tolist()
+    lst_day_out = (np.array(new_days) + lst_time_to_outcome).tolist()
+    admitted_beds = (TOTAL_BEDS - np.cumsum(lst_hospitalized)).tolist()
+
+    cases = {
+        'ran_pert_dist[1]': (lambda: project.ran_pert_dist(8, 10, 14, confidence=4, samples=1), 5, 1000),
+        'ran_pert_dist[1000]': (lambda: project.ran_pert_dist(8, 10, 14, confidence=4, samples=1000), 5, 1000),
+        'Variables.s_e': (project.Variables.s_e, 5, 10000),
+        'Variables.e_i': (project.Variables.e_i, 5, 10000),
+        'Variables.i_r': (project.Variables.i_r, 5, 10000),
+        'model[60]': (lambda: project.model(0, 60, POPULATION, TOTAL_BEDS), 5, 20),
+        'model[365]': (lambda: project.model(0, 365, POPULATION, TOTAL_BEDS), 5, 5),
+        'test_result_days[365]': (lambda: project.test_result_days(lst_day, lst_time_to_outcome, days, [], lst_outcome, [], lst_hospitalized, TOTAL_BEDS), 5, 200),
+        'admitted_bed[365]': (lambda: project.admitted_bed(days, new_days, lst_outcome, lst_day_out, lst_hospitalized, TOTAL_BEDS), 5, 200),
+        'available_bed[365]': (lambda: project.available_bed(days, lst_outcome, lst_day_out, TOTAL_BEDS, list(admitted_beds)), 5, 200),
+    }
+    for number_of_days, number_of_simulation in SCALES[:1] if quick else SCALES:
+        repeat = 3 if number_of_simulation <= 10000 else 1
+        scale = '[%dx%d]' % (number_of_days, number_of_simulation)
+        cases['simulation.pool' + scale] = (lambda d=number_of_days, n=number_of_simulation: project.simulation(d, n, POPULATION, TOTAL_BEDS, True, seed=1), repeat, 1)
+        cases['simulation.vectorized' + scale] = (lambda d=number_of_days, n=number_of_simulation: project.simulation(d, n, POPULATION, TOTAL_BEDS, False, vectorized=True, seed=1), repeat, 1)
+    # The per-simulation reference path only at the smallest scale
+    number_of_days, number_of_simulation = SCALES[0]
+    cases['simulation.reference[%dx%d]' % SCALES[0]] = (lambda: project.simulation(number_of_days, number_of_simulation, POPULATION, TOTAL_BEDS, False, seed=1), 1, 1)
+    return cases
+
+
+def save(results: dict, path: str):
+    """
+    Writes results to a JSON file, through a temporary file so that an interrupted write keeps the previous content
+    :param results: Results of run()
+    :param path: File of the results
+    """
+    with open(path + '.tmp', 'w') as file:
+        json.dump(results, file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def run(quick: bool = False, only: str = None, output: str = None) -> dict:
+    """
+    Runs the benchmarks
+    :param quick: Only the smallest scale of simulation()
+    :param only: Run only the benchmarks whose name contains this text
+    :param output: File the results are saved to after each benchmark, not saved when None
+    :return: Environment of the run and timing of every benchmark
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'results.json')
+    >>> results = run(only='model[60]', output=path)  # doctest: +ELLIPSIS
+    model[60]                                ... s
+    >>> with open(path) as file:
+    ...     list(json.load(file)['benchmarks'])
+    ['model[60]']
+    """
+    results = {'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                               'cpus': project.available_cpus(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'benchmarks': {}}
+    for name, (function, repeat, number) in benchmarks(quick).items():
+        if only and only not in name:
+            continue
+        results['benchmarks'][name] = timing = time_call(function, repeat, number)
+        print('%-40s %12.6f s' % (name, timing['best']), flush=True)
+        if output:
+            save(results, output)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> list:
+    """
+    Finds the benchmarks which got slower than the baseline
+    :param results: Results of run()
+    :param baseline: Results of an earlier run()
+    :param tolerance: Largest accepted slow down, 0.25 for 25%
+    :return: Name, baseline time, time and ratio of every regression
+    >>> compare({'benchmarks': {'a': {'best': 1.5}, 'b': {'best': 1.0}}}, {'benchmarks': {'a': {'best': 1.0}, 'b': {'best': 1.0}}})
+    [('a', 1.0, 1.5, 1.5)]
+    """
+    regressions = []
+    for name, timing in results['benchmarks'].items():
+        if name in baseline['benchmarks']:
+            before = baseline['benchmarks'][name]['best']
+            ratio = timing['best'] / before
+            if ratio > 1 + tolerance:
+                regressions.append((name, before, timing['best'], ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point, see the module docstring
+    :param argv: Command line arguments, sys.argv when None
+    :return: Exit status
+    """
+    parser = argparse.ArgumentParser(description='Benchmark suite of the hospital capacity simulation')
+    parser.add_argument('--quick', action='store_true', help='only the smallest scale of simulation()')
+    parser.add_argument('--only', help='run only the benchmarks whose name contains this text')
+    parser.add_argument('--output', default='benchmark_results.json', help='file of the results')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='file of the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='largest accepted slow down, 0.25 for 25%%')
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.only, args.output)
+    if args.save_baseline:
+        save(results, args.baseline)
+        print('Baseline saved to', args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline in', args.baseline, '- run with --save-baseline to store one')
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    for name, before, now, ratio in regressions:
+        print('REGRESSION %-40s %12.6f s -> %12.6f s (x%.2f)' % (name, before, now, ratio))
+    if not regressions:
+        print('No regression against', args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""
+Local simulation service of the Monte Carlo Simulation on Hospital Capacity During COVID-19
+
+Answers (population, total_beds, number_of_days, number_of_simulation, seed) questions over HTTP from one warm worker
+pool, and runs independent questions concurrently. Runs are kept in a least-recently-used cache in memory and on disk,
+keyed by the population, number of simulations and seed: the beds occupied do not depend on the number of beds, a
+shorter horizon is the first days of a cached one, and a longer horizon continues the cached simulations from their
+last day with model_extend() instead of starting again.
+
+Usage:
+    python service.py --port 8765 --cache-dir simulation_cache
+    curl 'http://127.0.0.1:8765/simulation?population=2710000&total_beds=33000&number_of_days=60&number_of_simulation=10000&seed=1'
+    curl 'http://127.0.0.1:8765/stats'
+"""
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import PR_final_project as project
+
+QUESTION_FIELDS = ('population', 'total_beds', 'number_of_days', 'number_of_simulation', 'seed')
+
+
+def run(coroutine):
+    """
+    Runs a coroutine on a new event loop and returns its result, as asyncio.run() which needs Python 3.7
+    :param coroutine: Coroutine to run
+    :return: Result of the coroutine
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class CachedRun:
+    """
+        Beds occupied on each day of every simulation of a run, with the state of each block of simulations after the
+        last day so that the run can be continued to a longer horizon
+        """
+    def __init__(self, occupancy: np.ndarray, states: list):
+        """
+        :param occupancy: Array of beds occupied of shape (number_of_simulation, number_of_days)
+        :param states: BatchState of each block of simulations, in the order of their simulation IDs
+        """
+        self.occupancy = occupancy
+        self.states = states
+
+    @property
+    def number_of_days(self) -> int:
+        """Number of days simulated"""
+        return self.occupancy.shape[1]
+
+
+class ResultCache:
+    """
+        Least-recently-used cache of CachedRun, in memory and optionally on disk
+        Each entry is written to the directory as one pickle file named after the hash of its key, and the files used
+        least recently are removed past disk_entries, so the cache outlives the service. Every use touches the file,
+        from memory as well as from disk, so the order on disk follows the order in memory
+        >>> directory = tempfile.mkdtemp()
+        >>> cache = ResultCache(directory, memory_entries=1)
+        >>> cache.put((1, 2, 3), CachedRun(np.zeros((2, 5)), []))
+        >>> cache.put((4, 5, 6), CachedRun(np.ones((2, 5)), []))
+        >>> list(cache.memory), cache.get((1, 2, 3)).number_of_days, list(cache.memory)
+        ([(4, 5, 6)], 5, [(1, 2, 3)])
+        >>> ResultCache(directory).get((4, 5, 6)).occupancy.tolist()
+        [[1.0, 1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0, 1.0]]
+        >>> small = ResultCache(tempfile.mkdtemp(), disk_entries=2)
+        >>> small.put((1,), CachedRun(np.zeros((1, 1)), []))
+        >>> os.utime(small._path((1,)), (0, 0))
+        >>> small.put((2,), CachedRun(np.zeros((1, 1)), []))
+        >>> os.utime(small._path((2,)), (1, 1))
+        >>> _ = small.get((1,))
+        >>> small.put((3,), CachedRun(np.zeros((1, 1)), []))
+        >>> [os.path.exists(small._path(key)) for key in [(1,), (2,), (3,)]]
+        [True, False, True]
+        """
+    def __init__(self, directory: str = None, memory_entries: int = 8, disk_entries: int = 64):
+        """
+        :param directory: Directory of the cache on disk, memory only when None
+        :param memory_entries: Number of runs kept in memory
+        :param disk_entries: Number of runs kept on disk
+        """
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: tuple) -> str:
+        """File of an entry on disk"""
+        return os.path.join(self.directory, hashlib.sha1(json.dumps(key).encode()).hexdigest() + '.pkl')
+
+    def get(self, key: tuple):
+        """
+        :param key: Key of the run
+        :return: The cached run, None when it is not cached
+        """
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self._touch(key)
+                return self.memory[key]
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as file:
+                run = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        with self._lock:
+            self._touch(key)
+        self._remember(key, run)
+        return run
+
+    def _touch(self, key: tuple):
+        """Marks the file of an entry as used now, unless it has been removed from disk; called under _lock"""
+        if self.directory is not None:
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def put(self, key: tuple, run: CachedRun):
+        """
+        Stores a run in memory and on disk
+        :param key: Key of the run
+        :param run: Run to store, it replaces any shorter run of the same key
+        """
+        self._remember(key, run)
+        if self.directory is None:
+            return
+        # Written under another name and then renamed, so that a reader never sees half a file
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            pickle.dump(run, file, protocol=pickle.HIGHEST_PROTOCOL)
+        # Another thread may remove the same files at the same time
+        with self._lock:
+            os.replace(path, self._path(key))
+            files = []
+            for entry in os.scandir(self.directory):
+                try:
+                    if entry.name.endswith('.pkl'):
+                        files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+            for mtime, oldest in sorted(files)[:max(len(files) - self.disk_entries, 0)]:
+                try:
+                    os.remove(oldest)
+                except FileNotFoundError:
+                    pass
+
+    def _remember(self, key: tuple, run: CachedRun):
+        """Stores a run in memory, dropping the one used least recently past memory_entries"""
+        with self._lock:
+            self.memory[key] = run
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+
+class SimulationService:
+    """
+        Runs the questions of the service on one warm SimulationExecutor pool, through a ResultCache
+        Questions run concurrently in threads which share the pool; questions with the same population, number of
+        simulations and seed wait for each other, so that the second one is answered from the run of the first.
+        Questions without a seed cannot be asked again, so they are neither cached nor waited for
+        >>> async def ask(service):
+        ...     answers = [await service.simulate(2710000, 33000, 30, 8, seed=1), await service.simulate(2710000, 66000, 20, 8, seed=1),
+        ...                await service.simulate(2710000, 33000, 60, 8, seed=1)]
+        ...     return [(answer['cache'], answer['number_of_days']) for answer in answers]
+        >>> with SimulationService(processes=1) as service:
+        ...     run(ask(service))
+        [('miss', 30), ('hit', 20), ('extended', 60)]
+        >>> with SimulationService(processes=1) as service:
+        ...     answer = run(service.simulate(2710000, 33000, 30, 8))
+        ...     answer['cache'], len(service.cache.memory), len(service._locks)
+        ('uncached', 0, 0)
+        >>> fresh = project.simulation_summary(60, 8, 2710000, 33000, do_threading=False, seed=1, progress=False)
+        >>> with SimulationService(processes=1) as service:
+        ...     run(service.simulate(2710000, 33000, 60, 8, seed=1))['overflow_probability'] == fresh.overflow_probability
+        True
+        """
+    def __init__(self, processes: int = None, cache_directory: str = None, memory_entries: int = 8, disk_entries: int = 64):
+        """
+        :param processes: Number of worker processes, all the available cores when None
+        :param cache_directory: Directory of the cache on disk, memory only when None
+        :param memory_entries: Number of runs kept in memory
+        :param disk_entries: Number of runs kept on disk
+        """
+        self.executor = project.SimulationExecutor(processes)
+        self.cache = ResultCache(cache_directory, memory_entries, disk_entries)
+        self.counts = collections.Counter()
+        self._locks = {}
+
+    def start(self):
+        """
+        Starts the worker processes, so that the first question does not wait for them
+        """
+        self.executor.pool
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        self.executor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def simulate(self, population: int, total_beds: int, number_of_days: int, number_of_simulation: int, seed: int = None) -> dict:
+        """
+        Answers one question
+        :param population: Population in the region considered
+        :param total_beds: Total hospital beds available in the region considered
+        :param number_of_days: Number of days for which the simulation has to run
+        :param number_of_simulation: Total number of simulations
+        :param seed: Master seed of the run, a fresh one which is not cached when None
+        :return: answer: Inputs and statistics of the run, see summary_record(), and how the cache was used: hit, extended, miss or uncached
+        """
+        loop = asyncio.get_event_loop()
+        if seed is None:
+            key = (population, number_of_simulation, np.random.SeedSequence().entropy)
+            return await loop.run_in_executor(None, self._simulate, key, total_beds, number_of_days, False)
+        key = (population, number_of_simulation, seed)
+        # Lock of the key and number of questions holding or waiting for it, dropped with the last of them
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await loop.run_in_executor(None, self._simulate, key, total_beds, number_of_days)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def _simulate(self, key: tuple, total_beds: int, number_of_days: int, cached: bool = True) -> dict:
+        """
+        Answers one question in a thread, from the cache or the pool
+        :param key: Population, number of simulations and seed
+        :param total_beds: Total hospital beds available in the region considered
+        :param number_of_days: Number of days for which the simulation has to run
+        :param cached: Look the run up in the cache and store it there
+        :return: answer: See simulate()
+        """
+        start = time.perf_counter()
+        population, number_of_simulation, seed = key
+        run = self.cache.get(key) if cached else None
+        if run is not None and run.number_of_days >= number_of_days:
+            status = 'hit'
+        elif cached:
+            status = 'miss' if run is None else 'extended'
+            run = self._run(key, number_of_days, run)
+            self.cache.put(key, run)
+        else:
+            status = 'uncached'
+            run = self._run(key, number_of_days)
+        self.counts[status] += 1
+
+        summary = project.SimulationSummary(number_of_days, total_beds)
+        summary.update(total_beds - run.occupancy[:, :number_of_days])
+        answer = {'population': population, 'total_beds': total_beds, 'number_of_days': number_of_days, 'seed': seed}
+        answer.update(project.summary_record(summary, days=True), cache=status, seconds=time.perf_counter() - start)
+        return answer
+
+    def _run(self, key: tuple, number_of_days: int, run: CachedRun = None) -> CachedRun:
+        """
+        Runs the simulations of a key on the pool, or continues a shorter cached run
+        :param key: Population, number of simulations and seed
+        :param number_of_days: Number of days for which the simulation has to run
+        :param run: Cached run with fewer days, None to start from day 0
+        :return: run: Run covering number_of_days
+        """
+        population, number_of_simulation, seed = key
+        if run is None:
+            chunk_size = self.executor.chunk_size(number_of_simulation)
+            blocks = [range(start, min(start + chunk_size, number_of_simulation)) for start in range(0, number_of_simulation, chunk_size)]
+        else:
+            blocks = run.states
+        # With no beds, the available beds are minus the beds occupied, which do not depend on the number of beds
+        results = sorted(self.executor.extend(number_of_days, population, 0, seed, blocks), key=lambda result: result[1].simulation_ids[0])
+        occupancy = -np.concatenate([bed_count for bed_count, state in results])
+        if run is not None:
+            occupancy = np.hstack([run.occupancy, occupancy])
+        return CachedRun(occupancy, [state for bed_count, state in results])
+
+    def stats(self) -> dict:
+        """
+        :return: Number of answers of each kind and runs cached in memory
+        """
+        return {'hit': self.counts['hit'], 'extended': self.counts['extended'], 'miss': self.counts['miss'], 'uncached': self.counts['uncached'],
+                'cached_runs': len(self.cache.memory)}
+
+
+def parse_question(query: str) -> dict:
+    """
+    Reads a question from the query string of a request
+    :param query: Query string, with every field of QUESTION_FIELDS except the optional seed
+    :return: question: Arguments of SimulationService.simulate()
+    >>> parse_question('population=2710000&total_beds=33000&number_of_days=60&number_of_simulation=1000')
+    {'population': 2710000, 'total_beds': 33000, 'number_of_days': 60, 'number_of_simulation': 1000, 'seed': None}
+    """
+    fields = {name: values[-1] for name, values in parse_qs(query).items()}
+    missing = [name for name in QUESTION_FIELDS[:-1] if name not in fields]
+    if missing:
+        raise ValueError('missing %s.' % ', '.join(missing))
+    question = {name: int(fields[name]) if name in fields else None for name in QUESTION_FIELDS}
+    if min(question['number_of_days'], question['number_of_simulation']) < 1:
+        raise ValueError('number_of_days and number_of_simulation must be at least 1.')
+    return question
+
+
+async def handle(service: SimulationService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Answers one HTTP request: GET /simulation with a question in the query string, or GET /stats
+    A question which cannot be answered gets a 500 response with the error, which is also printed with its traceback
+    :param service: Service answering the questions
+    :param reader: Stream of the request
+    :param writer: Stream of the response
+    """
+    status, body = 200, None
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()).strip():
+            pass
+        url = urlsplit(request_line[1]) if len(request_line) >= 2 else None
+        if url is None or request_line[0] != 'GET':
+            status, body = 400, {'error': 'only GET requests are served.'}
+        elif url.path == '/simulation':
+            body = await service.simulate(**parse_question(url.query))
+        elif url.path == '/stats':
+            body = service.stats()
+        else:
+            status, body = 404, {'error': 'unknown path %s.' % url.path}
+    except ValueError as error:
+        status, body = 400, {'error': str(error)}
+    except asyncio.CancelledError:
+        raise
+    except Exception as error:
+        traceback.print_exc()
+        status, body = 500, {'error': '%s: %s' % (type(error).__name__, error)}
+
+    payload = json.dumps(body).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+    writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n'
+                  % (status, reason, len(payload))).encode() + payload)
+    await writer.drain()
+    writer.close()
+
+
+def serve(host: str, port: int, service: SimulationService):
+    """
+    Serves the questions until interrupted
+    :param host: Address to listen on
+    :param port: Port to listen on
+    :param service: Service answering the questions
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(asyncio.start_server(lambda reader, writer: handle(service, reader, writer), host, port))
+    print('Serving on http://%s:%d' % (host, port))
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point, see the module docstring
+    :param argv: Command line arguments, sys.argv when None
+    :return: Exit status
+    """
+    parser = argparse.ArgumentParser(description='Local service of the hospital capacity simulation')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--processes', type=int, help='number of worker processes, all the available cores by default')
+    parser.add_argument('--cache-dir', help='directory of the cache on disk, memory only by default')
+    parser.add_argument('--memory-entries', type=int, default=8, help='number of runs kept in memory')
+    parser.add_argument('--disk-entries', type=int, default=64, help='number of runs kept on disk')
+    args = parser.parse_args(argv)
+
+    with SimulationService(args.processes, args.cache_dir, args.memory_entries, args.disk_entries) as service:
+        service.start()
+        try:
+            serve(args.host, args.port, service)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())